@@ -0,0 +1,270 @@
+import gzip
+import numpy as np
+import xml.etree.ElementTree as ET
+
+# Array-backed loading and statistics of (weighted, undirected) CNs, shared by
+# the analysis scripts
+
+GRAPHML_NS = '{http://graphml.graphdrawing.org/xmlns}'
+
+
+class UnionFind:
+    """Disjoint sets over the integers [0, n), with path halving and union by
+    size, tracking the number and largest size of the sets."""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        self.count = n
+        self.largest = 1 if n > 0 else 0
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, x, y):
+        # returns True if x and y were in different sets
+        rx, ry = self.find(x), self.find(y)
+        if rx == ry:
+            return False
+        if self.size[rx] < self.size[ry]:
+            rx, ry = ry, rx
+        self.parent[ry] = rx
+        self.size[rx] += self.size[ry]
+        self.count -= 1
+        if self.size[rx] > self.largest:
+            self.largest = self.size[rx]
+        return True
+
+
+class ArrayGraph:
+    """An undirected graph as a list of node ids plus parallel edge arrays of
+    node indices ('u', 'v') and weights."""
+
+    def __init__(self, nodes, u, v, weight):
+        self.nodes = nodes
+        self.u = u
+        self.v = v
+        self.weight = weight
+
+    def number_of_nodes(self):
+        return len(self.nodes)
+
+    def number_of_edges(self):
+        return len(self.u)
+
+    def component_labels(self):
+        """Returns (number of components, component label of each node)."""
+        n = self.number_of_nodes()
+        try:  # scipy is slow to import, so only when needed
+            from scipy.sparse import coo_matrix
+            from scipy.sparse.csgraph import connected_components
+        except ImportError:  # fall back to union-find
+            coo_matrix = connected_components = None
+
+        if connected_components != None:
+            adj = coo_matrix((np.ones(len(self.u), dtype=np.int8), (self.u, self.v)), shape=(n, n))
+            return connected_components(adj, directed=False)
+
+        uf = UnionFind(n)
+        for x, y in zip(self.u.tolist(), self.v.tolist()):
+            uf.union(x, y)
+        roots = np.fromiter((uf.find(x) for x in range(n)), dtype=np.int64, count=n)
+        _, labels = np.unique(roots, return_inverse=True)
+        return uf.count, labels
+
+    def largest_component_mask(self, labels=None):
+        # boolean mask over nodes of (one of) the largest component(s)
+        if labels is None:
+            _, labels = self.component_labels()
+        if len(labels) == 0:
+            return np.zeros(0, dtype=bool)
+        return labels == np.argmax(np.bincount(labels))
+
+    def subgraph(self, node_mask):
+        """The subgraph induced by the nodes in node_mask, re-indexed."""
+        new_ix = np.cumsum(node_mask) - 1
+        edge_mask = node_mask[self.u] & node_mask[self.v]
+        return ArrayGraph(
+            [n for n, keep in zip(self.nodes, node_mask) if keep],
+            new_ix[self.u[edge_mask]],
+            new_ix[self.v[edge_mask]],
+            self.weight[edge_mask]
+        )
+
+    def largest_component(self, labels=None):
+        return self.subgraph(self.largest_component_mask(labels))
+
+    def edge_subgraph(self, edge_mask):
+        """The subgraph of the edges in edge_mask and their nodes, re-indexed."""
+        node_mask = np.zeros(self.number_of_nodes(), dtype=bool)
+        node_mask[self.u[edge_mask]] = True
+        node_mask[self.v[edge_mask]] = True
+        new_ix = np.cumsum(node_mask) - 1
+        return ArrayGraph(
+            [n for n, keep in zip(self.nodes, node_mask) if keep],
+            new_ix[self.u[edge_mask]],
+            new_ix[self.v[edge_mask]],
+            self.weight[edge_mask]
+        )
+
+    def core_edge_mask(self, k, weighted=False):
+        """Mask over edges of the k-core: the edges left after repeatedly
+        removing nodes of degree (or if weighted, strength) less than k."""
+        n = self.number_of_nodes()
+        alive = np.ones(self.number_of_edges(), dtype=bool)
+        while True:
+            u, v = self.u[alive], self.v[alive]
+            w = self.weight[alive] if weighted else None
+            degrees = np.bincount(u, w, minlength=n) + np.bincount(v, w, minlength=n)
+            weak = degrees < k
+            dropped = alive & (weak[self.u] | weak[self.v])
+            if not dropped.any():
+                return alive
+            alive &= ~dropped
+
+    def truss_edge_mask(self, k):
+        """Mask over edges of the k-truss: the edges left after repeatedly
+        removing those in fewer than k - 2 triangles."""
+        from scipy.sparse import coo_matrix  # slow to import, so only when needed
+
+        n = self.number_of_nodes()
+        alive = np.ones(self.number_of_edges(), dtype=bool)
+        while alive.any():
+            ix = np.flatnonzero(alive)
+            u, v = self.u[ix], self.v[ix]
+            ones = np.ones(2 * len(ix), dtype=np.int32)
+            adj = coo_matrix((ones, (np.r_[u, v], np.r_[v, u])), shape=(n, n)).tocsr()
+            # an edge's triangles are its ends' common neighbours
+            support = np.asarray(adj.multiply(adj @ adj)[u, v]).ravel()
+            dropped = support < k - 2
+            if not dropped.any():
+                break
+            alive[ix[dropped]] = False
+        return alive
+
+    def label_propagation(self, max_iterations=100, seed=0):
+        """Communities found by weighted label propagation: each node takes the
+        label with the most weight amongst its neighbours (the lowest label of
+        any tied), with a random half of the nodes updated at a time so labels
+        don't oscillate. Returns (number of communities, community of each
+        node), numbered from the largest community."""
+        from scipy.sparse import coo_matrix, csr_matrix  # slow to import, so only when needed
+
+        n = self.number_of_nodes()
+        if n == 0:
+            return 0, np.zeros(0, dtype=np.int64)
+        adj = coo_matrix(
+            (np.r_[self.weight, self.weight], (np.r_[self.u, self.v], np.r_[self.v, self.u])), shape=(n, n)
+        ).tocsr()
+        connected = np.diff(adj.indptr) > 0
+        labels = np.arange(n)
+        rnd = np.random.default_rng(seed)
+        for _ in range(max_iterations):
+            # the total weight of each label amongst each node's neighbours
+            totals = adj @ csr_matrix((np.ones(n), (np.arange(n), labels)), shape=(n, n))
+            totals.sort_indices()  # so argmax() picks the lowest of tied labels
+            best = np.where(connected, np.asarray(totals.argmax(axis=1)).ravel(), labels)
+            changing = best != labels
+            if not changing.any():
+                break
+            changing &= rnd.random(n) < 0.5
+            labels[changing] = best[changing]
+
+        _, labels, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+        rank = np.empty(len(sizes), dtype=np.int64)
+        rank[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+        return len(sizes), rank[labels.ravel()]
+
+    def weight_stats(self):
+        # mean and population stdev, because we have all the edge weights
+        if len(self.weight) == 0:
+            return float('nan'), float('nan')
+        return float(np.mean(self.weight)), float(np.std(self.weight))
+
+    def density(self):
+        n = self.number_of_nodes()
+        if n <= 1:
+            return 0.0
+        return 2 * self.number_of_edges() / (n * (n - 1))
+
+
+def hccs(g, k=2, prune='CORE'):
+    """The highly coordinating communities of g: its k-core ('CORE'), k-core
+    by strength ('WEIGHTED_CORE') or k-truss ('TRUSS'), split into communities
+    by label propagation. Returns (the pruned subgraph, number of
+    communities, community of each of its nodes)."""
+    if prune == 'TRUSS':
+        mask = g.truss_edge_mask(k)
+    else:
+        mask = g.core_edge_mask(k, weighted=prune == 'WEIGHTED_CORE')
+    core = g.edge_subgraph(mask)
+    count, communities = core.label_propagation()
+    return core, count, communities
+
+
+def from_edges(edges, weight_property='weight'):
+    # an ArrayGraph of (u, v, edge_data) edges, e.g. from nx.Graph.edges(data=True)
+    n_ix = {}
+    us, vs, ws = [], [], []
+    for u, v, d in edges:
+        us.append(n_ix.setdefault(u, len(n_ix)))
+        vs.append(n_ix.setdefault(v, len(n_ix)))
+        ws.append(d[weight_property])
+    return ArrayGraph(
+        list(n_ix),
+        np.array(us, dtype=np.int64),
+        np.array(vs, dtype=np.int64),
+        np.array(ws, dtype=np.float64)
+    )
+
+
+def read_graphml(fn, weight_property='weight'):
+    """Streams a GraphML file into an ArrayGraph without building a networkx
+    graph. Edges lacking the weight property get its declared default (or 1)."""
+    n_ix = {}
+    us, vs, ws = [], [], []
+    weight_key = None
+    default_weight = 1.0
+    with (gzip.open(fn) if fn.lower().endswith('.gz') else open(fn, 'rb')) as source:
+        for _, elem in ET.iterparse(source, events=('end',)):
+            tag = elem.tag.replace(GRAPHML_NS, '')
+            if tag == 'key':
+                if elem.get('attr.name') == weight_property and elem.get('for') in ('edge', 'all'):
+                    weight_key = elem.get('id')
+                    default = elem.find(f'{GRAPHML_NS}default')
+                    if default is not None and default.text:
+                        default_weight = float(default.text)
+            elif tag == 'node':
+                n_ix.setdefault(elem.get('id'), len(n_ix))
+                elem.clear()
+            elif tag == 'edge':
+                us.append(n_ix.setdefault(elem.get('source'), len(n_ix)))
+                vs.append(n_ix.setdefault(elem.get('target'), len(n_ix)))
+                w = default_weight
+                for data in elem.iter(f'{GRAPHML_NS}data'):
+                    if data.get('key') == weight_key:
+                        w = float(data.text)
+                ws.append(w)
+                elem.clear()
+    return ArrayGraph(
+        list(n_ix),
+        np.array(us, dtype=np.int64),
+        np.array(vs, dtype=np.int64),
+        np.array(ws, dtype=np.float64)
+    )
+
+
+def read_npz(fn, weight_property='weight'):
+    # as written by find_coord_vsw.py --export-format NPZ
+    with np.load(fn) as z:
+        return ArrayGraph(z['nodes'].tolist(), z['u'], z['v'], z[weight_property])
+
+
+def read_graph(fn, weight_property='weight'):
+    if fn.lower().endswith('.npz'):
+        return read_npz(fn, weight_property)
+    return read_graphml(fn, weight_property)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+import csv
+import gen_synthetic_data
+import json
+import multiprocessing
+import os
+import os.path
+import random
+import resource
+import subprocess
+import sys
+import time
+import utils
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from find_coord_vsw import TextSimilarityComparator
+
+# Times the coordination pipeline and analysis scripts over synthetic data of
+# increasing scale, appending throughput and peak memory to a results CSV so
+# versions can be compared
+
+class Options:
+    def __init__(self):
+        self._init_parser()
+
+    def _init_parser(self):
+        usage = 'benchmark.py -o <results>.csv [--scales 1000,10000] [--windows 5m/10m,1h/1h] [-cmp EXACT_MATCH,TEXT_SIMILARITY]'
+
+        self.parser = ArgumentParser(usage=usage)
+        self.parser.add_argument(
+            '-o',
+            dest='results_file',
+            default='bench_results.csv',
+            help='CSV to append results to (default: bench_results.csv)'
+        )
+        self.parser.add_argument(
+            '--work-dir',
+            dest='work_dir',
+            default='bench_data',
+            help='Where to write generated data and outputs (default: bench_data)'
+        )
+        self.parser.add_argument(
+            '--scales',
+            dest='scales',
+            default='1000,10000',
+            help='Numbers of background events to generate, separated by commas (default: 1000,10000)'
+        )
+        self.parser.add_argument(
+            '--windows',
+            dest='windows',
+            default='5m/10m',
+            help='d1/d2 window pairs to run, separated by commas (default: 5m/10m)'
+        )
+        self.parser.add_argument(
+            '-cmp', '--comparison-strategies',
+            dest='comparison_strategies',
+            default='EXACT_MATCH',
+            help='Comparison strategies to run, separated by commas (default: EXACT_MATCH)'
+        )
+        self.parser.add_argument(
+            '--raw',
+            dest='raw',
+            action='store_true',
+            default=False,
+            help='Also benchmark raw tweet ingestion (HASHTAGS) (default: False)'
+        )
+        self.parser.add_argument(
+            '--accounts-per-event',
+            dest='accounts_per_event',
+            type=float,
+            default=0.1,
+            help='Background accounts generated per background event (default: 0.1)'
+        )
+        self.parser.add_argument(
+            '--label',
+            dest='label',
+            default=None,
+            help='Label for this set of results (default: git describe of the working tree)'
+        )
+        self.parser.add_argument(
+            '--seed',
+            dest='seed',
+            type=int,
+            default=42,
+            help='Random seed for the generated data (default: 42)'
+        )
+
+    def parse(self, args=None):
+        return self.parser.parse_args(args)
+
+
+COLUMNS = [
+    'label', 'when', 'benchmark', 'scale', 'params', 'events', 'seconds',
+    'events_per_s', 'peak_rss_mb', 'details'
+]
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def version_label():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], cwd=HERE,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_script(script, args):
+    """Runs one of this repo's scripts in a child process, returning its wall
+    time, peak RSS (MB) and stdout."""
+    cmd = [sys.executable, os.path.join(HERE, script)] + args
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=devnull, text=True)
+        out = p.stdout.read()
+        _, status, rusage = os.wait4(p.pid, 0)
+    seconds = time.perf_counter() - started
+    exit_code = os.waitstatus_to_exitcode(status)
+    if exit_code != 0:
+        raise RuntimeError(f'{" ".join(cmd)} failed with exit code {exit_code}')
+    # ru_maxrss is in KB on Linux
+    return seconds, rusage.ru_maxrss / 1024, out
+
+
+def peak_rss_of(fn, *args):
+    # fn's result and this process's peak RSS (MB) after running it
+    result = fn(*args)
+    # ru_maxrss is in KB on Linux
+    return result, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_in_child(fn, *args):
+    """Runs fn (which returns its time and details) in a fresh child process,
+    returning (seconds, peak RSS (MB), details), so the peak is the run's own,
+    as for run_script()."""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        (seconds, details), peak_mb = pool.submit(peak_rss_of, fn, *args).result()
+    return seconds, peak_mb, details
+
+
+def bench_find_coord(in_file, out_filebase, d1, d2, cmp, raw):
+    args = [
+        '-i', in_file, '-o', out_filebase, '-d1', d1, '-d2', d2, '-cmp', cmp,
+        '--final-g-only', '--metrics', f'{out_filebase}-metrics.json'
+    ]
+    if raw:
+        args += ['--raw', 'TWEETS', '--extract', 'HASHTAGS']
+    elif cmp == 'TEXT_SIMILARITY':
+        args += ['--tgt-col', 'text']
+    seconds, peak_mb, _ = run_script('find_coord_vsw.py', args)
+    with open(f'{out_filebase}-metrics.json', encoding='utf-8') as f:
+        summary = json.load(f)['summary']
+    return seconds, peak_mb, summary
+
+
+def time_text_similarity(texts, pairs, seed):
+    rnd = random.Random(seed)
+    sample = [(rnd.choice(texts), rnd.choice(texts)) for _ in range(pairs)]
+    comparator = TextSimilarityComparator(0.5, 5)
+    started = time.perf_counter()
+    matches = sum(1 for t1, t2 in sample if comparator.compare(t1, t2) > 0)
+    return time.perf_counter() - started, dict(pairs=pairs, matches=matches)
+
+
+def bench_text_similarity(events, pairs=20000, seed=42):
+    return run_in_child(time_text_similarity, [e[3] for e in events], pairs, seed)
+
+
+def time_hccs(gfn, k, with_networkx):
+    import analysis
+    import networkx as nx
+    import scipy.sparse  # so its (slow) import isn't timed
+
+    g = analysis.read_graph(gfn)
+    if with_networkx:
+        nx_g = nx.read_graphml(gfn)
+        find = lambda: len(list(nx.community.label_propagation_communities(nx.k_core(nx_g, k))))
+    else:
+        find = lambda: analysis.hccs(g, k)[1]
+    started = time.perf_counter()
+    communities = find()
+    return time.perf_counter() - started, dict(edges=g.number_of_edges(), communities=communities)
+
+
+def bench_hccs(gfn, k=2):
+    """Times finding the HCCs of a CN (k-core, then label propagation) with
+    the array-backed analysis core and then with networkx, each in its own
+    child process, returning (seconds, peak RSS (MB), details) for each."""
+    return [run_in_child(time_hccs, gfn, k, with_networkx) for with_networkx in [False, True]]
+
+
+class Results:
+    def __init__(self, fn, label):
+        self.fn = fn
+        self.label = label
+        self.when = utils.now_str()
+
+    def add(self, benchmark, scale, params, events, seconds, peak_mb, details=None):
+        row = dict(
+            label = self.label,
+            when = self.when,
+            benchmark = benchmark,
+            scale = scale,
+            params = params,
+            events = events,
+            seconds = f'{seconds:.4f}',
+            events_per_s = f'{events / seconds:.1f}' if seconds > 0 else '',
+            peak_rss_mb = f'{peak_mb:.1f}',
+            details = json.dumps(details) if details else ''
+        )
+        new_file = not os.path.exists(self.fn)
+        with open(self.fn, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+        utils.logts(f'{benchmark:<24} scale={scale:<8} {params:<28} {row["seconds"]:>9}s {row["events_per_s"]:>10} ev/s {row["peak_rss_mb"]:>7} MB')
+
+
+def run_benchmarks(opts):
+    os.makedirs(opts.work_dir, exist_ok=True)
+    results = Results(opts.results_file, opts.label or version_label())
+    windows = [w.split('/') for w in opts.windows.split(',')]
+    strategies = opts.comparison_strategies.split(',')
+
+    for scale in map(int, opts.scales.split(',')):
+        gen_cfg = gen_synthetic_data.config_from(
+            gen_synthetic_data.Options().parse([
+                '-n', f'{scale}', '--accounts', f'{max(10, int(scale * opts.accounts_per_event))}',
+                '--seed', f'{opts.seed}'
+            ])
+        )
+        events = gen_synthetic_data.generate_events(gen_cfg)
+        in_csv = os.path.join(opts.work_dir, f'synthetic-{scale}.csv')
+        gen_synthetic_data.write_csv(events, in_csv)
+        if opts.raw:
+            in_tweets = os.path.join(opts.work_dir, f'synthetic-{scale}.jsonl')
+            gen_synthetic_data.write_tweets(events, in_tweets, opts.seed)
+
+        final_g = None
+        for d1, d2 in windows:
+            for cmp in strategies:
+                params = f'd1={d1} d2={d2} cmp={cmp}'
+                out_filebase = os.path.join(opts.work_dir, f'cn-{scale}-{d1}-{d2}-{cmp}')
+                seconds, peak_mb, summary = bench_find_coord(in_csv, out_filebase, d1, d2, cmp, False)
+                results.add('find_coord_vsw', scale, params, len(events), seconds, peak_mb, summary)
+                if final_g is None:
+                    final_g = f'{out_filebase}-FINAL.graphml'
+                if opts.raw:
+                    seconds, peak_mb, summary = bench_find_coord(in_tweets, out_filebase + '-raw', d1, d2, cmp, True)
+                    results.add('find_coord_vsw_raw', scale, params, len(events), seconds, peak_mb, summary)
+
+        seconds, peak_mb, details = bench_text_similarity(events, seed=opts.seed)
+        results.add('text_similarity', scale, 'threshold=0.5', details['pairs'], seconds, peak_mb, details)
+
+        # the analysis scripts over the first CN produced at this scale
+        for script, params, args in [
+            ('quick_stats.py', '', [final_g]),
+            ('g_similarity.py', 'g1=g2', ['-g1', final_g, '-g2', final_g]),
+            ('filter_by_edge_weight.py', 'mw=2', ['-i', final_g, '-mw', '2', '--dry-run'])
+        ]:
+            seconds, peak_mb, _ = run_script(script, args)
+            results.add(script, scale, params, len(events), seconds, peak_mb)
+
+        (seconds, peak_mb, details), (nx_seconds, nx_peak_mb, nx_details) = bench_hccs(final_g)
+        results.add('hccs', scale, 'k=2', details['edges'], seconds, peak_mb, details)
+        results.add('hccs_networkx', scale, 'k=2', nx_details['edges'], nx_seconds, nx_peak_mb, nx_details)
+
+
+if __name__=='__main__':
+
+    options = Options()
+    opts = options.parse(sys.argv[1:])
+
+    start_time = time.time()
+    run_benchmarks(opts)
+    utils.logts(f'DONE having taken {time.time() - start_time:.1f} seconds, results in {opts.results_file}')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import runpy
+import shlex
+import sys
+import time
+import traceback
+import utils
+
+# A single entry point to the scripts, e.g.,
+#
+#   coord.py find -i events.csv -o cn-out -d1 5m -d2 10m --final-g-only
+#   coord.py stats --header cn-out-FINAL.graphml
+#
+# 'batch' runs many such commands (one per line, '#' for comments) in this
+# one interpreter, so slow imports (networkx, numpy, scipy) are paid once:
+#
+#   coord.py batch jobs.txt
+
+COMMANDS = {
+    'find'       : 'find_coord_vsw',
+    'stats'      : 'quick_stats',
+    'similarity' : 'g_similarity',
+    'filter'     : 'filter_by_edge_weight',
+    'report'     : 'edge_weight_report',
+    'synth'      : 'gen_synthetic_data',
+    'benchmark'  : 'benchmark',
+    'tweets2csv' : 'extract_tweets_as_csv',
+    'rts2csv'    : 'extract_retweets_as_csv'
+}
+
+USAGE = f'''usage: coord.py <command> [args...]
+       coord.py batch <commands.txt | ->
+
+commands: {", ".join(COMMANDS)}
+(use 'coord.py <command> -h' for a command's own options)'''
+
+
+def run_command(argv):
+    """Runs the script for argv[0] as if from the command line with argv[1:],
+    returning its exit status rather than exiting."""
+    if not argv or argv[0] not in COMMANDS:
+        utils.eprint(USAGE)
+        return 2
+
+    module = COMMANDS[argv[0]]
+    saved_argv = sys.argv
+    sys.argv = [f'{module}.py'] + argv[1:]
+    try:
+        runpy.run_module(module, run_name='__main__', alter_sys=True)
+        return 0
+    except SystemExit as e:
+        if e.code == None or isinstance(e.code, int):
+            return e.code or 0
+        utils.eprint(e.code)  # sys.exit('message')
+        return 1
+    except Exception:
+        # one failed command shouldn't end a batch
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.argv = saved_argv
+
+
+def run_batch(fn):
+    # returns the number of commands that failed
+    f = sys.stdin if fn == '-' else open(fn, encoding='utf-8')
+    failures = 0
+    try:
+        for line_no, line in enumerate(f, start=1):
+            argv = shlex.split(line, comments=True)
+            if not argv:
+                continue
+            started = time.time()
+            utils.logts(f'[{line_no}] {" ".join(argv)}')
+            status = run_command(argv)
+            if status != 0:
+                failures += 1
+            utils.logts(f'[{line_no}] exit status {status} after {time.time() - started:.1f} seconds')
+    finally:
+        if f is not sys.stdin: f.close()
+    return failures
+
+
+if __name__=='__main__':
+
+    if len(sys.argv) < 2 or sys.argv[1] in ['-h', '--help']:
+        print(USAGE)
+        sys.exit(0 if len(sys.argv) > 1 else 2)
+
+    if sys.argv[1] == 'batch':
+        if len(sys.argv) != 3:
+            utils.eprint(USAGE)
+            sys.exit(2)
+        failures = run_batch(sys.argv[2])
+        if failures:
+            utils.eprint(f'{failures} command(s) failed')
+        sys.exit(1 if failures else 0)
+
+    sys.exit(run_command(sys.argv[1:]))
@@ -0,0 +1,109 @@
+import find_coord_vsw
+import uuid
+
+from find_coord_vsw import BatchManager, Options, config_error, config_from
+
+# Runs the sliding window coordination search in-process, on events from any
+# iterable rather than a file, e.g.:
+#
+#   from detector import CoordinationDetector
+#
+#   detector = CoordinationDetector('5m', '10m', comparison_strategy='CASE_INSENSITIVE')
+#   g = detector.detect(events)  # an nx.Graph
+#
+#   for start_ts, end_ts, g in detector.windows(events):
+#       ...
+#
+# where each event is a dict with 'ts' (epoch seconds), 'src' (the account)
+# and 'tgt' (what binds accounts), plus 't_id' (the post) if keep_history is
+# set, and events are in time order.
+
+
+class CoordinationDetector:
+    """Detects coordination as find_coord_vsw.py does, with the same options
+    given as keyword arguments named as that script's config keys (e.g.,
+    decay_strategy='HALF_LIFE', decay_period='6h', final_g_min_edge_weight=2).
+
+    Nothing is written to disk unless an option asks for it (e.g., keep_history
+    or edge_store, with out_filebase), and windows() can't be used with those
+    that need final_g_only. Each call to detect() or windows() uses
+    its own BatchManager, so a detector may be re-used, and separate calls may
+    run concurrently in different threads (although logging and trace_memory
+    are process-wide). With keep_history, each call writes its history under
+    its own filebase (out_filebase plus a unique suffix), given by its CNs'
+    'history_filebase' graph attribute for history.read_history().
+    """
+
+    # config keys about reading and writing files (and the stages only run on
+    # them) rather than detection
+    NOT_OPTIONS = [
+        'in_file', 'raw_data', 'extract_what', 'id_col', 'ts_col', 'src_col', 'tgt_col',
+        'dry_run', 'final_g_only', 'export_format', 'gzip', 'metrics_file', 'prefilter', 'prefilter_buckets',
+        'save_state', 'append_to', 'entity_cache_size', 'hccs_file', 'hcc_prune', 'hcc_k'
+    ]
+
+    def __init__(self, d1, d2=None, **options):
+        # the script's defaults, then the options given
+        self.cfg = config_from(Options().parse(['-i', '-', '-o', 'cn', '-d1', str(d1)]))
+        self.cfg['metrics_file'] = None
+        for k, v in options.items():
+            if k not in self.cfg or k in CoordinationDetector.NOT_OPTIONS:
+                raise ValueError(f'Unknown option: {k}')
+            self.cfg[k] = v
+        self.cfg['d2'] = self.cfg['d1'] if d2 == None else seconds(d2)
+        self.cfg['decay_period'] = seconds(self.cfg['decay_period'])
+        if isinstance(self.cfg['max_memory'], str):
+            self.cfg['max_memory'] = find_coord_vsw.convert_to_bytes(self.cfg['max_memory'])
+        self.cfg['decay_prune_every'] = max(1, self.cfg['decay_prune_every'])
+
+    def manager(self, final_g_only):
+        # a fresh BatchManager (with its own copy of the config) per run
+        cfg = dict(self.cfg, final_g_only=final_g_only)
+        if cfg['keep_history']:
+            # so concurrent calls don't overwrite (or remove) each other's chunks
+            cfg['out_filebase'] = f'{cfg["out_filebase"]}-{uuid.uuid4().hex[:8]}'
+        error = config_error(cfg)
+        if error:
+            raise ValueError(error)
+        return BatchManager(cfg)
+
+    def extraction_lists(self, events):
+        # each event on its own, as an Extractor gives them, without those on
+        # the exclude_targets
+        excluded = set(self.cfg['exclude_targets'])
+        return ([e] for e in events if e['tgt'] not in excluded)
+
+    def windows(self, events):
+        """Yields (window start ts, window end ts, g) for each window, where g
+        is a snapshot of the cumulative CN at the end of that window. The last
+        is the final CN, filtered by final_g_min_edge_weight."""
+        mgr = self.manager(False)
+        for start_w_ts, end_w_ts, g, final in mgr.windows(self.extraction_lists(events)):
+            if final:
+                g = mgr.final_graph(g, end_w_ts)
+            yield start_w_ts, end_w_ts, self.annotated(g, mgr)
+
+    def detect(self, events, metrics=None):
+        """Returns the final CN of the events. If given, metrics (a dict) is
+        updated with the run's summary metrics."""
+        mgr = self.manager(True)
+        final_g = None
+        for _, end_w_ts, g, final in mgr.windows(self.extraction_lists(events)):
+            if final:
+                final_g = mgr.final_graph(g, end_w_ts)
+        if metrics != None:
+            metrics.update(mgr.metrics.summary())
+        if final_g == None:  # no events
+            final_g = find_coord_vsw.graph_from_edges([])
+        return self.annotated(final_g, mgr)
+
+    def annotated(self, g, mgr):
+        # notes where the run's history is, if it's kept
+        if self.cfg['keep_history']:
+            g.graph['history_filebase'] = mgr.cfg['out_filebase']
+        return g
+
+
+def seconds(t):
+    # accepts seconds or a value + unit, as for -d1
+    return t if isinstance(t, (int, float)) else find_coord_vsw.convert_to_secs(t)
@@ -0,0 +1,142 @@
+import numpy as np
+import sqlite3
+
+from spill import edge_rows
+
+# A persistent, queryable alternative to holding the whole CN in memory: each
+# window's edges are upserted as partial aggregates into an SQLite table
+
+
+class SqliteEdgeStore:
+    """CN edges in an SQLite database file, keyed by (u, v) with u < v.
+
+    Weights and first counts of rows for the same edge are summed as they are
+    upserted; if a decay is in use, each is first scaled by the decay's
+    merge_factors, as the upserted row is the edge's later co-activity. The
+    database remains after the run, e.g.:
+
+        sqlite3 <db> 'SELECT u, v, weight FROM edges ORDER BY weight DESC LIMIT 10'
+    """
+    UPSERT = '''
+        INSERT INTO edges (u, v, weight, first_u, first_v, last_ts, since_ts, history_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (u, v) DO UPDATE SET
+            weight = edges.weight * merge_factor(0, edges.last_ts, excluded.since_ts, excluded.last_ts)
+                + excluded.weight * merge_factor(1, edges.last_ts, excluded.since_ts, excluded.last_ts),
+            first_u = edges.first_u * merge_factor(0, edges.last_ts, excluded.since_ts, excluded.last_ts)
+                + excluded.first_u * merge_factor(1, edges.last_ts, excluded.since_ts, excluded.last_ts),
+            first_v = edges.first_v * merge_factor(0, edges.last_ts, excluded.since_ts, excluded.last_ts)
+                + excluded.first_v * merge_factor(1, edges.last_ts, excluded.since_ts, excluded.last_ts),
+            last_ts = max(edges.last_ts, excluded.last_ts),
+            since_ts = CASE WHEN merge_factor(0, edges.last_ts, excluded.since_ts, excluded.last_ts) = 0
+                THEN excluded.since_ts ELSE edges.since_ts END,
+            history_id = coalesce(edges.history_id, excluded.history_id)
+    '''
+
+    def __init__(self, fn, decay):
+        self.fn = fn
+        self.conn = sqlite3.connect(fn)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+
+        # int 1s without a decay, so int weights stay ints
+        def decay_factor(last_ts, now_ts):
+            if last_ts == None or now_ts == None:
+                return 1
+            return decay.factor(now_ts - last_ts)
+        self.conn.create_function('decay_factor', 2, decay_factor, deterministic=True)
+
+        def merge_factor(which, last_ts, part_since_ts, part_last_ts):
+            if last_ts == None or part_last_ts == None:
+                return 1
+            return decay.merge_factors(last_ts, part_since_ts, part_last_ts)[which]
+        self.conn.create_function('merge_factor', 4, merge_factor, deterministic=True)
+
+        def is_forgotten(weight, last_ts, now_ts, min_ew):
+            edge_data = dict(weight=weight, first_u=0.0, first_v=0.0, last_ts=last_ts)
+            return decay.is_forgotten(edge_data, now_ts, min_ew)
+        self.conn.create_function('is_forgotten', 4, is_forgotten, deterministic=True)
+
+        with self.conn:
+            self.conn.execute('DROP TABLE IF EXISTS edges')
+            self.conn.execute('''
+                CREATE TABLE edges (
+                    u TEXT NOT NULL,
+                    v TEXT NOT NULL,
+                    weight NOT NULL,  -- no type, so int weights stay ints
+                    first_u REAL NOT NULL,
+                    first_v REAL NOT NULL,
+                    last_ts INTEGER,
+                    since_ts INTEGER,
+                    history_id INTEGER,
+                    PRIMARY KEY (u, v)
+                ) WITHOUT ROWID
+            ''')
+
+    def upsert(self, g):
+        """Adds g's edges to the store in one transaction, returning how many."""
+        rows = edge_rows(g)
+        with self.conn:
+            self.conn.executemany(SqliteEdgeStore.UPSERT, rows)
+        return len(rows)
+
+    def history_id(self, u, v):
+        if u > v:
+            u, v = v, u
+        row = self.conn.execute('SELECT history_id FROM edges WHERE u = ? AND v = ?', (u, v)).fetchone()
+        return row[0] if row else None
+
+    def prune(self, now_ts, min_ew):
+        # drops edges the decay has forgotten by now_ts, as forget_edges() does
+        with self.conn:
+            return self.conn.execute(
+                'DELETE FROM edges WHERE is_forgotten(weight, last_ts, ?, ?)', (now_ts, min_ew)
+            ).rowcount
+
+    def edges(self, now_ts=None, min_ew=-1.0):
+        """Yields (u, v, edge_data) for each edge whose weight (decayed to
+        now_ts, if given) is at least min_ew."""
+        for u, v, w, fu, fv, last_ts, history_id in self.conn.execute('''
+            SELECT u, v, weight * f, first_u * f, first_v * f, last_ts, history_id
+            FROM (SELECT *, decay_factor(last_ts, ?) AS f FROM edges)
+            WHERE weight * f >= ?
+            ORDER BY u, v
+        ''', (now_ts, min_ew)):
+            d = dict(weight=w, first_u=fu, first_v=fv)
+            if last_ts != None:
+                d['last_ts'] = last_ts
+            if history_id != None:
+                d['history_id'] = history_id
+            yield u, v, d
+
+    def number_of_edges(self):
+        return self.conn.execute('SELECT count(*) FROM edges').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def export_npz(edges, fn):
+    """Writes (u, v, edge_data) edges as compressed numpy arrays: 'nodes' (the
+    node ids) and per edge 'u' and 'v' (indices into 'nodes'), 'weight',
+    'first_u' and 'first_v'. Returns the number of nodes and edges."""
+    n_ix = {}
+    us, vs, ws, fus, fvs = [], [], [], [], []
+    for u, v, d in edges:
+        if u > v:  # first_u is always for the lesser id
+            u, v = v, u
+        us.append(n_ix.setdefault(u, len(n_ix)))
+        vs.append(n_ix.setdefault(v, len(n_ix)))
+        ws.append(d['weight'])
+        fus.append(d['first_u'])
+        fvs.append(d['first_v'])
+    np.savez_compressed(
+        fn,
+        nodes=np.array(list(n_ix), dtype=str),
+        u=np.array(us, dtype=np.int64),
+        v=np.array(vs, dtype=np.int64),
+        weight=np.array(ws, dtype=np.float64),
+        first_u=np.array(fus, dtype=np.float64),
+        first_v=np.array(fvs, dtype=np.float64)
+    )
+    return len(n_ix), len(us)
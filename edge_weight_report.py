@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+import analysis
+import csv
+import numpy as np
+import sys
+import utils
+
+from argparse import ArgumentParser
+
+# Reports how a CN falls apart as its minimum edge weight rises, to help choose
+# --final-g-min-ew: from a single load, the edge weight distribution and, for
+# each candidate threshold, the surviving nodes, edges and components
+
+
+class Options:
+    def __init__(self):
+        self._init_parser()
+
+    def _init_parser(self):
+        usage = 'edge_weight_report.py -i <in.graphml> [-o <thresholds.csv>] [-d <distribution.csv>] [-t <weight>...]'
+
+        self.parser = ArgumentParser(usage=usage)
+        self.parser.add_argument(
+            '-i',
+            required=True,
+            dest='in_file',
+            help='A weighted network (graphml or npz)'
+        )
+        self.parser.add_argument(
+            '-o',
+            required=False,
+            default=None,
+            dest='out_file',
+            help='Where to write the threshold curve CSV (default: modified in file name)'
+        )
+        self.parser.add_argument(
+            '-d', '--distribution',
+            required=False,
+            default=None,
+            dest='dist_file',
+            help='Where to write the edge weight histogram CSV (default: modified in file name)'
+        )
+        self.parser.add_argument(
+            '-t', '--thresholds',
+            type=float,
+            nargs='+',
+            default=None,
+            dest='thresholds',
+            help='Candidate minimum edge weights (default: every distinct edge weight)'
+        )
+        self.parser.add_argument(
+            '-b', '--bins',
+            type=int,
+            default=50,
+            dest='bins',
+            help='Number of histogram bins (default: 50)'
+        )
+        self.parser.add_argument(
+            '--log-bins',
+            dest='log_bins',
+            action='store_true',
+            default=False,
+            help='Space the histogram bins logarithmically (default: False)'
+        )
+        self.parser.add_argument(
+            '-p', '--weight-property',
+            required=False,
+            default='weight',
+            dest='weight_property',
+            help='Name of weight property (default "weight")'
+        )
+        self.parser.add_argument(
+            '-v', '--verbose',
+            dest='verbose',
+            action='store_true',
+            default=False,
+            help='Verbose logging (default: False)'
+        )
+
+    def parse(self, args=None):
+        return self.parser.parse_args(args)
+
+
+THRESHOLD_COLUMNS = [
+    'min_weight', 'nodes', 'edges', 'components', 'largest_component_nodes',
+    'largest_component_fraction'
+]
+QUANTILES = [0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 1.0]
+
+
+def threshold_curve(g, thresholds=None):
+    """Yields a dict of THRESHOLD_COLUMNS for each threshold (default: each
+    distinct weight), heaviest first. Edges are added in decreasing order of
+    weight to a union-find, so the whole curve costs one pass."""
+    order = np.argsort(-g.weight, kind='stable')
+    us = g.u[order].tolist()
+    vs = g.v[order].tolist()
+    ws = g.weight[order].tolist()
+    if thresholds is None:
+        thresholds = np.unique(g.weight)
+    thresholds = sorted(set(float(t) for t in thresholds), reverse=True)
+
+    uf = analysis.UnionFind(g.number_of_nodes())
+    touched = [False] * g.number_of_nodes()
+    nodes = unions = i = 0
+    for t in thresholds:
+        while i < len(ws) and ws[i] >= t:
+            for x in (us[i], vs[i]):
+                if not touched[x]:
+                    touched[x] = True
+                    nodes += 1
+            if uf.union(us[i], vs[i]):
+                unions += 1
+            i += 1
+        largest = uf.largest if i > 0 else 0
+        yield dict(
+            min_weight = t,
+            nodes = nodes,
+            edges = i,
+            components = nodes - unions,
+            largest_component_nodes = largest,
+            largest_component_fraction = largest / nodes if nodes else 0.0
+        )
+
+
+def histogram(weights, bins=50, log_bins=False):
+    # (lower, upper, count, cumulative fraction) for each bin
+    if log_bins and len(weights) and weights.min() > 0:
+        edges = np.geomspace(weights.min(), weights.max(), bins + 1)
+    else:
+        edges = bins
+    counts, bin_edges = np.histogram(weights, bins=edges)
+    cumulative = np.cumsum(counts) / max(1, len(weights))
+    return zip(bin_edges[:-1].tolist(), bin_edges[1:].tolist(), counts.tolist(), cumulative.tolist())
+
+
+DEBUG=False
+OVERRIDE=True
+def log(msg, override=False):
+    if DEBUG or override: utils.eprint('[%s] %s' % (utils.now_str(), msg))
+
+
+if __name__=='__main__':
+
+    options = Options()
+    opts = options.parse(sys.argv[1:])
+
+    DEBUG=opts.verbose
+
+    STARTING_TIME = utils.now_str()
+    log('Starting', OVERRIDE)
+
+    in_gfn = opts.in_file
+    filebase = in_gfn[:in_gfn.rindex(".")]
+    out_fn = opts.out_file or f'{filebase}-thresholds.csv'
+    dist_fn = opts.dist_file or f'{filebase}-ew-distribution.csv'
+
+    g = analysis.read_graph(in_gfn, opts.weight_property)
+    print(f'In file:  {in_gfn}')
+    print(f'In:  V={g.number_of_nodes():>8,} E={g.number_of_edges():>8,}')
+    if g.number_of_edges() == 0:
+        print('Empty graph')
+        sys.exit(1)
+
+    for q, w in zip(QUANTILES, np.quantile(g.weight, QUANTILES).tolist()):
+        print(f'Edge weight q{q:<4}: {w:,.3f}')
+
+    with open(dist_fn, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['bin_lower', 'bin_upper', 'edges', 'cumulative_fraction'])
+        writer.writerows(histogram(g.weight, opts.bins, opts.log_bins))
+    print(f'Distribution: {dist_fn}')
+
+    with open(out_fn, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=THRESHOLD_COLUMNS)
+        writer.writeheader()
+        row_count = 0
+        for row in threshold_curve(g, opts.thresholds):
+            writer.writerow(row)
+            row_count += 1
+    print(f'Thresholds: {out_fn} ({row_count:,} candidate weights)')
+
+    log('DONE having started at %s,' % STARTING_TIME, OVERRIDE)
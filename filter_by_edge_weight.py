@@ -12,7 +12,7 @@ class Options:
         self._init_parser()
 
     def _init_parser(self):
-        usage = 'filter_by_edge_weight.py -i <in.graphml> -o <out.graphml> -mw <weight> [--dry-run]'
+        usage = 'filter_by_edge_weight.py -i <in.graphml> -o <out.graphml> -mw <weight> [<weight>...] [--dry-run]'
 
         self.parser = ArgumentParser(usage=usage)
         self.parser.add_argument(
@@ -26,14 +26,15 @@ class Options:
             required=False,
             default=None,
             dest='out_file',
-            help='The filtered network (default: modified in file name)'
+            help='The filtered network, with "-min<weight>" inserted before the extension if there are several weights (default: modified in file name)'
         )
         self.parser.add_argument(
             '-mw', '--min-weight',
             required=True,
             type=float,
-            dest='min_weight',
-            help='Minimum edge weight to retain'
+            nargs='+',
+            dest='min_weights',
+            help='Minimum edge weight(s) to retain, one filtered network per weight'
         )
         self.parser.add_argument(
             '-p', '--weight-property',
@@ -61,6 +62,19 @@ class Options:
         return self.parser.parse_args(args)
 
 
+def mk_out_fn(in_gfn, out_gfn, min_weight, several):
+    if not out_gfn:
+        return f'{in_gfn[:in_gfn.rindex(".")]}-min{min_weight}.graphml'
+    if several:
+        return f'{out_gfn[:out_gfn.rindex(".")]}-min{min_weight}{out_gfn[out_gfn.rindex("."):]}'
+    return out_gfn
+
+
+def heaviest_first(g, weight_property='weight'):
+    # (u, v, weight) for each edge of g, in decreasing order of weight
+    return sorted(g.edges(data=weight_property), key=lambda e: e[2], reverse=True)
+
+
 DEBUG=False
 OVERRIDE=True
 def log(msg, override=False):
@@ -82,29 +96,29 @@ if __name__=='__main__':
         sys.exit(1)
 
     in_gfn = opts.in_file
-    out_gfn = opts.out_file
-    if not out_gfn:
-        out_gfn = f'{in_gfn[:in_gfn.rindex(".")]}-min{opts.min_weight}.graphml'
-        # print(out_gfn)
-        # sys.exit(0)
+    several = len(set(opts.min_weights)) > 1
 
     in_g = nx.read_graphml(in_gfn)
-    print(f'Min weight: {opts.min_weight}')
     print(f'In file:  {in_gfn}')
-    print(f'Out file: {out_gfn}')
     print(f'In:  V={in_g.number_of_nodes():>8,} E={in_g.number_of_edges():>8,}')
 
-    for u, v, _ in [
-        (u, v, w) for u, v, w in in_g.edges(data=opts.weight_property) if w < opts.min_weight
-    ]:
-        in_g.remove_edge(u, v)
-
-    for n, _ in [(n, d) for n, d in in_g.degree() if d == 0 ]:
-        in_g.remove_node(n)
-
-    print(f'Out: V={in_g.number_of_nodes():>8,} E={in_g.number_of_edges():>8,}')
-
-    if not opts.dry_run:
-        nx.write_graphml(in_g, out_gfn)
+    # the edges are sorted once and, taking the heaviest weights first, each
+    # filtered network is the previous one plus the next run of lighter edges
+    edges = heaviest_first(in_g, opts.weight_property)
+    nodes = set()  # those incident to retained edges, so isolates are dropped
+    edge_count = 0
+    for min_weight in sorted(set(opts.min_weights), reverse=True):
+        while edge_count < len(edges) and edges[edge_count][2] >= min_weight:
+            nodes.add(edges[edge_count][0])
+            nodes.add(edges[edge_count][1])
+            edge_count += 1
+
+        out_gfn = mk_out_fn(in_gfn, opts.out_file, min_weight, several)
+        print(f'Min weight: {min_weight}')
+        print(f'Out file: {out_gfn}')
+        print(f'Out: V={len(nodes):>8,} E={edge_count:>8,}')
+
+        if not opts.dry_run:
+            nx.write_graphml(in_g.edge_subgraph((u, v) for u, v, _ in edges[:edge_count]), out_gfn)
 
     log('DONE having started at %s,' % STARTING_TIME, OVERRIDE)
@@ -3,16 +3,17 @@
 import csv
 import gzip
 import json
-import networkx as nx
+import pickle
+import random
 import re
-import regex
-import statistics
+import spill
 import sys
 import time
 import utils
 
 from argparse import ArgumentParser
-from typing import Pattern
+from collections import OrderedDict
+from metrics import Metrics
 
 # Searches timestamped interactions for coordination using a genuine sliding
 # window
@@ -119,7 +120,14 @@ class Options:
             dest='keep_history',
             action='store_true',
             default=False,
-            help='Maintains lists of connecting reasons and order of co-activities, using a lot of memory (default: False)'
+            help='Records connecting reasons and order of co-activities in a side table on disk, referenced by edge "history_id" (default: False)'
+        )
+        self.parser.add_argument(
+            '--history-chunk-size',
+            dest='history_chunk_size',
+            type=int,
+            default=100000,
+            help='Number of history rows held in memory before spilling them to disk (default: 100000)'
         )
         self.parser.add_argument(
             '--dry-run',
@@ -142,6 +150,166 @@ class Options:
             default=-1.0,
             help='Filters the CN edge weights before writing to disk (default: -1)'
         )
+        self.parser.add_argument(
+            '--decay',
+            dest='decay_strategy',
+            choices=Decays.STRATEGIES,
+            default='NONE',
+            help='How edge weights are forgotten over time (default: NONE)'
+        )
+        self.parser.add_argument(
+            '--decay-period',
+            dest='decay_period_arg',
+            default='1d',
+            help='Half-life (HALF_LIFE) or maximum age since last co-activity (EXPIRY), value + unit as for -d1 (default: 1d)'
+        )
+        self.parser.add_argument(
+            '--decay-min-ew',
+            dest='decay_min_edge_weight',
+            type=float,
+            default=0.1,
+            help='Decayed edges lighter than this are pruned from the CN (default: 0.1)'
+        )
+        self.parser.add_argument(
+            '--decay-prune-every',
+            dest='decay_prune_every',
+            type=int,
+            default=10,
+            help='Number of windows between pruning passes over the CN (default: 10)'
+        )
+        self.parser.add_argument(
+            '--max-target-events',
+            dest='max_target_events',
+            type=int,
+            default=-1,
+            help='Most events sharing one target that are compared per window, see --target-overflow (default: -1, no limit)'
+        )
+        self.parser.add_argument(
+            '--target-overflow',
+            dest='target_overflow',
+            choices=['SAMPLE', 'CAP', 'SKIP'],
+            default='SAMPLE',
+            help='For targets over --max-target-events, randomly sample that many events (rescaling their edge weights), keep the earliest, or skip them all (default: SAMPLE)'
+        )
+        self.parser.add_argument(
+            '--max-memory',
+            dest='max_memory_arg',
+            default=None,
+            help='Approximate memory budget, value + unit, e.g. 4G (K, M, G); the queue and CN edges are spilled to disk beyond it (requires --final-g-only) (default: None)'
+        )
+        self.parser.add_argument(
+            '--save-state',
+            dest='save_state',
+            default=None,
+            help='Save the state of the sliding window before the final window to this file, so a later run can carry on with --append-to (default: None)'
+        )
+        self.parser.add_argument(
+            '--append-to',
+            dest='append_to',
+            default=None,
+            help='Carry on from a --save-state file with the input that followed it, giving the same CN as one run over all of the input (default: None)'
+        )
+        self.parser.add_argument(
+            '--edge-store',
+            dest='edge_store',
+            default=None,
+            help='Accumulate the CN in this SQLite database file rather than in memory, leaving it queryable afterwards (requires --final-g-only) (default: None)'
+        )
+        self.parser.add_argument(
+            '--top-pairs',
+            dest='top_pairs',
+            type=int,
+            default=-1,
+            help='Approximate only the CN\'s strongest k pairs, in fixed memory, with their estimated weight and a lower bound, weight_min (requires --final-g-only) (default: -1, the whole CN)'
+        )
+        self.parser.add_argument(
+            '--top-pairs-width',
+            dest='top_pairs_width',
+            type=int,
+            default=2 ** 20,
+            help='Width of the --top-pairs sketch, at 32 bytes per column; wider gives tighter estimates (default: 1048576)'
+        )
+        self.parser.add_argument(
+            '--entity-cache-size',
+            dest='entity_cache_size',
+            type=int,
+            default=100000,
+            help='How many retweeted/quoted tweets\' extracted entities to remember, so each is only extracted once (default: 100000)'
+        )
+        self.parser.add_argument(
+            '--prefilter',
+            dest='prefilter',
+            action='store_true',
+            default=False,
+            help='Read the input twice, first to find targets used by only one account, so their events can be dropped rather than queued and compared (EXACT_MATCH and CASE_INSENSITIVE only) (default: False)'
+        )
+        self.parser.add_argument(
+            '--prefilter-buckets',
+            dest='prefilter_buckets',
+            type=int,
+            default=2 ** 22,
+            help='Size of the --prefilter sketch, at 9 bytes per bucket; more buckets drop more events (default: 4194304)'
+        )
+        self.parser.add_argument(
+            '--engine',
+            dest='engine',
+            choices=['LOOP', 'SPARSE'],
+            default='LOOP',
+            help='How each window is compared: pair by pair, or (without --decay or --keep-history) all at once with sparse matrices of accounts and targets, or of texts and their tokens for TEXT_SIMILARITY (default: LOOP)'
+        )
+        self.parser.add_argument(
+            '--export-format',
+            dest='export_format',
+            choices=['GRAPHML', 'NPZ'],
+            default='GRAPHML',
+            help='Format of the final CN: GraphML, or numpy arrays of nodes and edges (default: GRAPHML)'
+        )
+        self.parser.add_argument(
+            '--hccs',
+            dest='hccs_file',
+            default=None,
+            help='Write the highly coordinating communities of the final CN to this CSV, as each node\'s community (default: None)'
+        )
+        self.parser.add_argument(
+            '--hcc-prune',
+            dest='hcc_prune',
+            choices=['CORE', 'WEIGHTED_CORE', 'TRUSS'],
+            default='CORE',
+            help='How the final CN is pruned before finding --hccs: to its k-core, its k-core by node strength, or its k-truss (default: CORE)'
+        )
+        self.parser.add_argument(
+            '--hcc-k',
+            dest='hcc_k',
+            type=float,
+            default=2,
+            help='The k of --hcc-prune (default: 2)'
+        )
+        self.parser.add_argument(
+            '--gzip',
+            dest='gzip',
+            action='store_true',
+            default=False,
+            help='Gzip the GraphML files written (as *.graphml.gz) (default: False)'
+        )
+        self.parser.add_argument(
+            '--metrics',
+            dest='metrics_file',
+            default=None,
+            help='Write per-window counters and timings to this file, as JSON if it ends in .json, otherwise CSV (default: None)'
+        )
+        self.parser.add_argument(
+            '--trace-memory',
+            dest='trace_memory',
+            action='store_true',
+            default=False,
+            help='Track Python allocations with tracemalloc, reporting peaks per window (slow) (default: False)'
+        )
+        self.parser.add_argument(
+            '--profile',
+            dest='profile_file',
+            default=None,
+            help='Run under cProfile and write the stats to this file (default: None)'
+        )
         self.parser.add_argument(
             '-v', '--verbose',
             dest='verbose',
@@ -158,10 +326,21 @@ class Extractor:
     EXTRACTABLES = ['HASHTAGS', 'URLS', 'RETWEETS', 'REPLIES', 'MENTIONS', 'QUOTES', 'TEXT', 'DOMAINS']
     def __init__(self, exclude_targets):
         self.to_exclude = exclude_targets
+        self.prefilter = None  # a SourceSketch, see prefiltered()
+        self.keep_from_ts = None  # events from then on are never prefiltered
 
     def extract(self, post):
         pass
 
+    def prefiltered(self, extractions):
+        # drops the extractions whose targets can't produce an edge
+        if self.prefilter == None:
+            return extractions
+        return [
+            e for e in extractions
+            if self.prefilter.may_match(e['tgt']) or (self.keep_from_ts != None and e['ts'] >= self.keep_from_ts)
+        ]
+
 
 class CsvExtractor(Extractor):
     def __init__(self, id_col, ts_col, src_col, tgt_col, exclude_targets):
@@ -186,14 +365,39 @@ class CsvExtractor(Extractor):
 class TweetExtractor(Extractor):
     # used to avoid catching Twitter URLs and domains
     TWEET_URL_REGEX = re.compile('https://twitter.com/[^/]*/status/.*')
-
-    def __init__(self, what, exclude_targets):
+    # what a post must contain for anything to be extracted from it, so posts
+    # without it needn't be decoded at all
+    MUST_CONTAIN = {
+        'RETWEETS': re.compile(r'"retweeted_status"\s*:\s*\{'),
+        'QUOTES': re.compile(r'"quoted_status"\s*:\s*\{'),
+        'REPLIES': re.compile(r'"in_reply_to_status_id_str"\s*:\s*"'),
+        'HASHTAGS': re.compile(r'"hashtags"\s*:\s*\[\s*\{'),
+        'URLS': re.compile(r'"urls"\s*:\s*\[\s*\{'),
+        'DOMAINS': re.compile(r'"urls"\s*:\s*\[\s*\{'),
+        'MENTIONS': re.compile(r'"user_mentions"\s*:\s*\[\s*\{')
+    }
+
+    def __init__(self, what, exclude_targets, cache_size=0, metrics=None):
         super().__init__(exclude_targets)
         self.field = what
+        # what's extracted from each retweeted/quoted tweet, by its id
+        self.originals = LruCache(cache_size)
+        self.metrics = metrics
+        self.must_contain = TweetExtractor.MUST_CONTAIN.get(what)
+        self.loads = tweet_decoder()
+
+    def original(self, ot, extract):
+        # extract(ot), re-used for each post embedding the same tweet
+        hit = ot['id_str'] in self.originals
+        if self.metrics != None:
+            self.metrics.count('entity_cache_hits' if hit else 'entity_cache_misses')
+        return self.originals.get(ot['id_str'], lambda: tuple(extract(ot)))
 
     def extract(self, post):
         # may result in multiple extractions
-        t = json.loads(post)
+        if self.must_contain != None and not self.must_contain.search(post):
+            return []
+        t = self.loads(post)
         extractions = []
         extract_template = {
             'ts' : parse_ts(t['created_at']),
@@ -211,26 +415,36 @@ class TweetExtractor(Extractor):
             extract_template['tgt'] = t['in_reply_to_user_id_str']
             extractions.append(extract_template)
         elif self.field == 'TEXT' and not utils.is_rt(t): # avoid retweets
-            extract_template['tgt'] = utils.extract_text(t)
+            if utils.is_qt(t):  # as utils.extract_text(t)
+                qt_text = self.original(t['quoted_status'], lambda qt: [utils.extract_text(qt)])[0]
+                extract_template['tgt'] = utils.available_text(t) + ' --> ' + qt_text
+            else:
+                extract_template['tgt'] = utils.extract_text(t)
             extractions.append(extract_template)
         elif self.field == 'HASHTAGS':
-            for ht in utils.lowered_hashtags_from(t, include_retweet=True):
+            hashtags = utils.lowered_hashtags_from(t)
+            if utils.is_rt(t):  # as utils.lowered_hashtags_from(t, include_retweet=True)
+                hashtags += self.original(utils.get_ot_from_rt(t), utils.lowered_hashtags_from)
+            for ht in hashtags:
                 if ht in self.to_exclude:
                     continue
                 ht_extract = extract_template.copy()
                 ht_extract['tgt'] = ht
                 extractions.append(ht_extract)
         elif self.field == 'URLS':
-            for url in utils.expanded_urls_from(t, include_retweet=True):
-                if TWEET_URL_REGEX.match(url) or url in self.to_exclude:
+            for url in self.expanded_urls_from(t):
+                if self.TWEET_URL_REGEX.match(url) or url in self.to_exclude:
                     continue
                 url_extract = extract_template.copy()
                 url_extract['tgt'] = url
                 extractions.append(url_extract)
         elif self.field == 'DOMAINS':
-            domains = [
-                utils.extract_domain(url) for url in utils.expanded_urls_from(t, include_retweet=True)
-            ]
+            domains = [utils.extract_domain(url) for url in utils.expanded_urls_from(t)]
+            if utils.is_rt(t):
+                domains += self.original(
+                    utils.get_ot_from_rt(t),
+                    lambda ot: [utils.extract_domain(url) for url in utils.expanded_urls_from(ot)]
+                )
             for domain in domains:
                 if domain == 'twitter.com' or domain in self.to_exclude:
                     continue
@@ -240,7 +454,7 @@ class TweetExtractor(Extractor):
         elif self.field == 'MENTIONS':
             if utils.is_rt(t):
                 # NB this avoids implicit mention of retweeted account
-                mentions = utils.mentioned_ids_from(utils.get_ot_from_rt(t))
+                mentions = self.original(utils.get_ot_from_rt(t), utils.mentioned_ids_from)
             else:
                 mentions = utils.mentioned_ids_from(t)
 
@@ -253,12 +467,74 @@ class TweetExtractor(Extractor):
         # return them
         return extractions
 
+    def expanded_urls_from(self, t):
+        # as utils.expanded_urls_from(t, include_retweet=True)
+        urls = utils.expanded_urls_from(t)
+        if utils.is_rt(t):
+            urls += self.original(utils.get_ot_from_rt(t), utils.expanded_urls_from)
+        return urls
+
+
+def tweet_decoder():
+    """A json.loads for posts: pysimdjson's lazy parse if it's installed, which
+    only decodes the fields that are read, or else orjson's or json's."""
+    try:
+        import simdjson
+
+        parser = simdjson.Parser()
+        def lazy_loads(post):
+            # each post invalidates the previous one's, so extract() mustn't
+            # keep them beyond strings and numbers
+            try:
+                return parser.parse(post)
+            except ValueError:  # an unusual post, which json may still read
+                return json.loads(post)
+        return lazy_loads
+    except ImportError:
+        pass
+    try:
+        import orjson
+
+        return orjson.loads
+    except ImportError:
+        return json.loads
+
+
+class LruCache:
+    """Up to maxsize values, forgetting the least recently used first."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.values = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def get(self, key, make):
+        if key in self.values:
+            self.values.move_to_end(key)
+            return self.values[key]
+        value = make()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        if self.maxsize > 0:
+            self.values[key] = value
+            self.values.move_to_end(key)
+            if len(self.values) > self.maxsize:
+                self.values.popitem(last=False)
+
 
 class Comparator:
     def compare(self, x, y):
         # return comparison strength: 0 for different, > 0 for similar (1 for same)
         pass
 
+    def next_window(self):
+        # called as each window is processed, for comparators that remember
+        pass
+
 
 class ExactMatchComparator(Comparator):
     def compare(self, x, y):
@@ -271,15 +547,14 @@ class CaseInsensitiveComparator(Comparator):
 
 
 class TextSimilarityComparator(Comparator):
+    SCORES_CACHE_SIZE = 100000  # similar pairs of distinct texts
+
     def __init__(self, threshold=0.9, min_tokens=5):
+        import regex  # only text similarity needs it, and it's slow to import
+
         self.threshold = threshold
         self.min_tokens = min_tokens
-
-    def compare(self, str1, str2):
-        """
-        Method borrowed from https://github.com/QUT-Digital-Observatory/coordination-network-toolkit/blob/main/coordination_network_toolkit/similarity.py
-        """
-        word_tokeniser = regex.compile(
+        self.word_tokeniser = regex.compile(
             # Note this handles 'quoted' words a little weirdly: 'orange' is tokenised
             # as ["orange", "'"] I'd prefer to tokenise this as ["'", "orange", "'"]
             # but the regex library behaves weirdly. So for now phrase search for
@@ -287,18 +562,34 @@ class TextSimilarityComparator(Comparator):
             r"\b\p{Word_Break=WSegSpace}*'?",
             flags=regex.WORD | regex.UNICODE | regex.V1,
         )
+        self.tokens = WindowMemo()  # lowered text -> its tokens
+        self.scores = LruCache(TextSimilarityComparator.SCORES_CACHE_SIZE)  # (lowered text, lowered text) -> similarity
 
-        def tokenise(text: str, tokenizer: Pattern = word_tokeniser) -> str:
-            # words = sorted(set(t for t in tokenizer.split(text.lower()) if t))
-            # tokenized = " ".join(words)
-            # return tokenized
-            return sorted(set(t for t in tokenizer.split(text.lower()) if t))
-
-        set1 = set(tokenise(str1))
+    def compare(self, str1, str2):
+        """
+        Method borrowed from https://github.com/QUT-Digital-Observatory/coordination-network-toolkit/blob/main/coordination_network_toolkit/similarity.py
+        """
+        # copypasta means many events share the same text, so each distinct
+        # text is tokenised once and each similar distinct pair is scored once
+        key1, key2 = str1.lower(), str2.lower()
+        if key1 == key2:
+            if len(self.tokens_of(key1)) < self.min_tokens:
+                return False  # 0
+            return 1.0 if 1.0 > self.threshold else 0
+        key = (key1, key2) if key1 < key2 else (key2, key1)
+        if key in self.scores:
+            return self.scores.get(key, None)
+        comparison = self.score(*key)
+        if comparison:  # most pairs score 0, and aren't worth remembering
+            self.scores.put(key, comparison)
+        return comparison
+
+    def score(self, key1, key2):
+        set1 = self.tokens_of(key1)
         if len(set1) < self.min_tokens:
             return False  # 0
 
-        set2 = set(tokenise(str2))
+        set2 = self.tokens_of(key2)
         if len(set2) < self.min_tokens:
             return False  # 0
 
@@ -308,6 +599,74 @@ class TextSimilarityComparator(Comparator):
         else:
             return 0  # treat as _entirely_ dissimilar
 
+    def tokenise(self, text: str) -> list:
+        # words = sorted(set(t for t in tokenizer.split(text.lower()) if t))
+        # tokenized = " ".join(words)
+        # return tokenized
+        return sorted(set(t for t in self.word_tokeniser.split(text.lower()) if t))
+
+    def tokens_of(self, key):
+        return self.tokens.get(key, lambda: frozenset(self.tokenise(key)))
+
+    def next_window(self):
+        self.tokens.next_window()
+
+    def similar_texts(self, texts):
+        """Scores every pair of the distinct texts amongst texts as compare()
+        does, all at once: each distinct text is a row of a sparse binary
+        token matrix, so a matrix product gives the pairs' intersections and
+        row sums their unions. Returns (the index of each text's distinct
+        text, a sparse matrix of the distinct texts' similarities above the
+        threshold)."""
+        import numpy as np
+        from scipy.sparse import csr_matrix
+
+        ix = {}
+        text_ix = np.fromiter((ix.setdefault(t.lower(), len(ix)) for t in texts), dtype=np.int64, count=len(texts))
+
+        vocab = {}
+        indptr, indices = [0], []
+        for key in ix:
+            tokens = self.tokens_of(key)
+            if len(tokens) >= self.min_tokens:  # too short to match anything
+                indices.extend(vocab.setdefault(t, len(vocab)) for t in tokens)
+            indptr.append(len(indices))
+        x = csr_matrix(
+            (np.ones(len(indices), dtype=np.int64), indices, indptr),
+            shape=(len(ix), len(vocab))
+        )
+        sizes = np.diff(x.indptr)
+
+        # identical texts share all their tokens, so score 1
+        shared = (x @ x.T).tocoo()
+        similarity = shared.data / (sizes[shared.row] + sizes[shared.col] - shared.data)
+        similar = similarity > self.threshold
+        scores = csr_matrix(
+            (similarity[similar], (shared.row[similar], shared.col[similar])),
+            shape=(len(ix), len(ix))
+        )
+        return text_ix, scores
+
+
+class WindowMemo:
+    """Remembers values while they're in use: those not used since the
+    window before last are forgotten when a new window starts."""
+
+    def __init__(self):
+        self.current = {}
+        self.previous = {}
+
+    def get(self, key, make):
+        if key in self.current:
+            return self.current[key]
+        value = self.previous.pop(key) if key in self.previous else make()
+        self.current[key] = value
+        return value
+
+    def next_window(self):
+        self.previous = self.current
+        self.current = {}
+
 
 class Comparators:
     def get_instance(comparison_strategy, **kwargs):
@@ -322,8 +681,117 @@ class Comparators:
             return ExactMatchComparator()
 
 
+class Decay:
+    """Forgets edge weight based on the time since an edge's last co-activity.
+
+    Decay is applied lazily: an edge's 'weight' and first counts are only
+    brought up to date when the edge is next touched (or when the whole graph
+    is aged), using the 'last_ts' recorded on the edge. Its 'since_ts' is
+    the co_ts at which its current weight began accruing.
+    """
+    enabled = True
+
+    def factor(self, elapsed):
+        # multiplier for weight unchanged for elapsed seconds
+        pass
+
+    def apply(self, edge_data, now_ts):
+        # brings edge_data up to now_ts, returns the (decayed) weight
+        pass
+
+    def merge_factors(self, last_ts, part_since_ts, part_last_ts):
+        # (multiplier for an edge's weight, multiplier for a partial aggregate
+        # of its later co-activity, accrued from part_since_ts to
+        # part_last_ts) when they're summed, e.g., from spilled runs
+        now_ts = max(last_ts, part_last_ts)
+        return self.factor(now_ts - last_ts), self.factor(now_ts - part_last_ts)
+
+    def is_forgotten(self, edge_data, now_ts, min_ew):
+        return self.apply(edge_data, now_ts) < min_ew
+
+
+class NoDecay(Decay):
+    enabled = False
+
+    def factor(self, elapsed):
+        return 1.0
+
+    def apply(self, edge_data, now_ts):
+        return edge_data['weight']
+
+    def merge_factors(self, last_ts, part_since_ts, part_last_ts):
+        return 1, 1  # so int weights stay ints
+
+    def is_forgotten(self, edge_data, now_ts, min_ew):
+        return False
+
+
+class HalfLifeDecay(Decay):
+    def __init__(self, half_life):
+        self.half_life = half_life
+
+    def factor(self, elapsed):
+        return 0.5 ** (elapsed / self.half_life) if elapsed > 0 else 1.0
+
+    def apply(self, edge_data, now_ts):
+        elapsed = now_ts - edge_data['last_ts']
+        if elapsed > 0:
+            factor = self.factor(elapsed)
+            edge_data['weight'] *= factor
+            edge_data['first_u'] *= factor
+            edge_data['first_v'] *= factor
+            edge_data['last_ts'] = now_ts
+        return edge_data['weight']
+
+
+class ExpiryDecay(Decay):
+    def __init__(self, max_age):
+        self.max_age = max_age
+
+    def factor(self, elapsed):
+        return 0.0 if elapsed > self.max_age else 1.0
+
+    def apply(self, edge_data, now_ts):
+        if now_ts - edge_data['last_ts'] > self.max_age:
+            # start afresh, as though the edge had never existed
+            edge_data['weight'] = 0.0
+            edge_data['first_u'] = 0.0
+            edge_data['first_v'] = 0.0
+            edge_data['last_ts'] = now_ts
+            edge_data['since_ts'] = now_ts
+        return edge_data['weight']
+
+    def merge_factors(self, last_ts, part_since_ts, part_last_ts):
+        # the edge's weight is only kept if it hadn't expired by the time the
+        # later co-activity began, i.e., as if they'd been added in turn
+        return self.factor(part_since_ts - last_ts), 1.0
+
+    def is_forgotten(self, edge_data, now_ts, min_ew):
+        return now_ts - edge_data['last_ts'] > self.max_age or edge_data['weight'] < min_ew
+
+
+class Decays:
+    STRATEGIES = ['NONE', 'HALF_LIFE', 'EXPIRY']
+
+    def get_instance(decay_strategy, **kwargs):
+        if decay_strategy == 'HALF_LIFE':
+            return HalfLifeDecay(kwargs['decay_period'])
+        elif decay_strategy == 'EXPIRY':
+            return ExpiryDecay(kwargs['decay_period'])
+        else:  # decay_strategy == 'NONE'
+            return NoDecay()
+
+
 
 class BatchManager:
+    # the options a --save-state file must be carried on with
+    STATE_OPTIONS = [
+        'd1', 'd2', 'extract_what', 'exclude_targets', 'comparison_strategy',
+        'text_similarity_threshold', 'text_similarity_min_tokens', 'decay_strategy',
+        'decay_period', 'decay_min_edge_weight', 'decay_prune_every',
+        'max_target_events', 'target_overflow', 'final_g_only'
+    ]
+
     def __init__(self, config):
         self.cfg = config
         self.csv_mode = self.cfg['raw_data'] == None
@@ -332,6 +800,33 @@ class BatchManager:
             text_similarity_threshold = config['text_similarity_threshold'],
             text_similarity_min_tokens = config['text_similarity_min_tokens']
         )
+        self.decay = Decays.get_instance(
+            config['decay_strategy'],
+            decay_period = config['decay_period']
+        )
+        self.history = None
+        self.next_edge_id = 0
+        self.metrics = Metrics(config['trace_memory'])
+        self.throttled = {}
+        self.rnd = random.Random(0)
+        self.spill_dir = None
+        self.edge_spiller = None
+        self.queue_spiller = None
+        self.edge_store = None
+        self.resumed = None  # the saved state to carry on from, see load_state()
+        self.sparse_engine = config['engine'] == 'SPARSE' and self.can_project()
+
+    def can_project(self):
+        # the sparse engine has no per-pair timestamps (for decay or history)
+        if self.decay.enabled or self.cfg['keep_history']:
+            log('The SPARSE engine does not support decay or history, using LOOP', OVERRIDE)
+            return False
+        try:
+            import scipy
+        except ImportError:
+            log('The SPARSE engine requires scipy, using LOOP', OVERRIDE)
+            return False
+        return True
 
     def open_file(self, in_file):
         if in_file[-1].lower() == 'z':  # assumes *.gz
@@ -348,84 +843,357 @@ class BatchManager:
                 g.add_node(n_id, label=n_id)
 
         new_g = old_g.copy() if not (self.cfg['final_g_only'] or self.cfg['dry_run']) else old_g
+        self.comparator.next_window()
+        if self.sparse_engine:
+            return self.process_sparse(batch, d1_end_ts, new_g)
+
+        comparisons = matches = edges_created = 0
         for i in range(len(batch) - 1):
             if batch[i]['ts'] >= d1_end_ts:
                 break
+            comparisons += len(batch) - i - 1
             for j in range(i+1, len(batch)):
                 u = batch[i]
                 v = batch[j]
                 comparison_strength = self.comparator.compare(u['tgt'], v['tgt'])
                 if u['src'] != v['src'] and comparison_strength > 0:
+                    matches += 1
+                    if 'scale' in u:  # stands in for events dropped by throttle()
+                        comparison_strength *= u['scale']
                     check_node(new_g, u['src'])
                     check_node(new_g, v['src'])
+                    co_ts = max(u['ts'], v['ts'])
+                    # first_u/first_v count how often each end was active first,
+                    # where the 'u' end is the node with the lesser id
+                    u_is_lesser = u['src'] < v['src']
                     if not new_g.has_edge(u['src'], v['src']):
+                        edges_created += 1
                         # 'first' is to track the first co-activity acct
                         # including the timestamp will mean entries can be forgotten
                         new_g.add_edge(
                             u['src'], v['src'],
                             weight = comparison_strength,
-                            first_counts = { u['src'] : 1.0, v['src'] : 0.0 }
+                            first_u = 1.0 if u_is_lesser else 0.0,
+                            first_v = 0.0 if u_is_lesser else 1.0
                         )
+                        if self.decay.enabled:
+                            new_g[u['src']][v['src']]['last_ts'] = co_ts
+                            new_g[u['src']][v['src']]['since_ts'] = co_ts
                         if keep_history:
-                            new_g[u['src']][v['src']]['first'] = [{
-                                'src': u['src'], 'ts': u['ts'], 't_id': u['t_id']
-                            }]
-                            new_g[u['src']][v['src']]['reasons'] = [{
-                                'tgt': u['tgt'], 'ts': u['ts'], 'ut_id': u['t_id'], 'vt_id': v['t_id']
-                            }]
+                            # the edge's rows in the history table share its id
+                            new_g[u['src']][v['src']]['history_id'] = self.history_id_for(u['src'], v['src'])
                     else:
-                        new_g[u['src']][v['src']]['weight'] += comparison_strength
-                        new_g[u['src']][v['src']]['first_counts'][u['src']] += 1.0
-                        if keep_history:
-                            new_g[u['src']][v['src']]['first'].append({
-                                'src': u['src'], 'ts': u['ts'], 't_id': u['t_id']
-                            })
-                            new_g[u['src']][v['src']]['reasons'].append({
-                                'tgt': u['tgt'], 'ts': u['ts'], 'ut_id': u['t_id'], 'vt_id': v['t_id']
-                            })
-            # no forgetting at the moment
+                        decay_factor = 1  # keeps the comparators' int strength
+                        if self.decay.enabled:
+                            # pairs aren't met in co_ts order, so never go back in time,
+                            # but decay an earlier pair's strength up to the edge's last_ts
+                            self.decay.apply(new_g[u['src']][v['src']], co_ts)
+                            new_g[u['src']][v['src']]['last_ts'] = max(co_ts, new_g[u['src']][v['src']]['last_ts'])
+                            new_g[u['src']][v['src']]['since_ts'] = min(co_ts, new_g[u['src']][v['src']]['since_ts'])
+                            decay_factor = self.decay.factor(new_g[u['src']][v['src']]['last_ts'] - co_ts)
+                        new_g[u['src']][v['src']]['weight'] += comparison_strength * decay_factor
+                        new_g[u['src']][v['src']]['first_u' if u_is_lesser else 'first_v'] += decay_factor
+                    if keep_history:
+                        self.history.append(
+                            new_g[u['src']][v['src']]['history_id'],
+                            u['ts'], u['t_id'], v['t_id'], u['tgt'], u['src']
+                        )
+            # forgetting is lazy, see forget_edges()
+        self.metrics.count('comparisons', comparisons)
+        self.metrics.count('matches', matches)
+        self.metrics.count('edges_created', edges_created)
         return new_g
 
-    def write_g(self, g, fn, dont_write_to_disk, verbose=False, keep_history=False):
+    def process_sparse(self, batch, d1_end_ts, new_g):
+        # as for process(), but with the window's pairs found by projection
+        import projection
+
+        if self.cfg['comparison_strategy'] == 'TEXT_SIMILARITY':
+            accounts, us, vs, weights, first_us, first_vs, matches = projection.similar_coactivity(batch, d1_end_ts, self.comparator)
+        else:
+            target_key = None
+            if self.cfg['comparison_strategy'] == 'CASE_INSENSITIVE':
+                target_key = lambda tgt: str(tgt).lower()
+            accounts, us, vs, weights, first_us, first_vs, matches = projection.coactivity(batch, d1_end_ts, target_key)
+
+        edges_created = 0
+        for u, v, w, first_u, first_v in zip(
+            [accounts[i] for i in us.tolist()], [accounts[i] for i in vs.tolist()],
+            weights.tolist(), first_us.tolist(), first_vs.tolist()
+        ):
+            if w == first_u + first_v and not isinstance(self.comparator, TextSimilarityComparator):
+                # no scaled matches, so keep the comparators' int strength
+                w = int(w)
+            if new_g.has_edge(u, v):
+                d = new_g[u][v]
+                d['weight'] += w
+                d['first_u'] += first_u
+                d['first_v'] += first_v
+            else:
+                edges_created += 1
+                if not new_g.has_node(u):
+                    new_g.add_node(u, label=u)
+                if not new_g.has_node(v):
+                    new_g.add_node(v, label=v)
+                new_g.add_edge(u, v, weight=w, first_u=first_u, first_v=first_v)
+
+        early = min(projection.early_count(batch, d1_end_ts), len(batch) - 1)
+        self.metrics.count('comparisons', early * (len(batch) - 1) - early * (early - 1) // 2)
+        self.metrics.count('matches', matches)
+        self.metrics.count('edges_created', edges_created)
+        return new_g
+
+    def history_id_for(self, u, v):
+        if self.edge_store != None:
+            history_id = self.edge_store.history_id(u, v)
+            if history_id != None:
+                return history_id
+        if self.edge_spiller != None:
+            # re-use the id of an edge that has been spilled to disk
+            history_id = self.edge_spiller.history_ids.pop((u, v) if u < v else (v, u), None)
+            if history_id != None:
+                return history_id
+        self.next_edge_id += 1
+        return self.next_edge_id - 1
+
+    def forget_edges(self, g, now_ts):
+        # bring all edge weights up to now_ts and prune those that have decayed
+        # below the floor, so g tracks recent coordination rather than all history
+        if not self.decay.enabled:
+            return g
+
+        min_ew = self.cfg['decay_min_edge_weight']
+        if self.edge_store != None:
+            # g only holds the current window's edges, the rest are stored
+            self.edge_store.upsert(g)
+            g.clear()
+            forgotten = self.edge_store.prune(now_ts, min_ew)
+            log(f'Forgot {forgotten:,} stored edges older than {ts_s(now_ts)}')
+            return g
+
+        for u, v in [
+            (u, v) for u, v, d in g.edges(data=True) if self.decay.is_forgotten(d, now_ts, min_ew)
+        ]:
+            g.remove_edge(u, v)
+
+        for n, _ in [(n, d) for n, d in g.degree() if d == 0 ]:
+            g.remove_node(n)
+
+        log(f'Forgot edges older than {ts_s(now_ts)}: V={g.number_of_nodes():,},E={g.number_of_edges():,}')
+        return g
+
+    def write_g(self, g, fn, dont_write_to_disk, verbose=False):
         if not dont_write_to_disk:
-            tmp_g = g.copy()
-            # calc average 'first_count' for each node
-            for n, n_id in g.nodes(data='label'):
-                # get adjacent edges and their data
-                tmp_g.nodes[n]['first_proportion'] = statistics.mean(
-                    edge_data['first_counts'][n_id] for _, edge_data in g[n].items()
-                )
-            # flatten complex structures to JSON
-            for u, v, d in g.edges(data=True):
-                tmp_g[u][v]['first_counts'] = json.dumps(tmp_g[u][v]['first_counts'])
-                if keep_history:
-                    tmp_g[u][v]['first'] = json.dumps(g[u][v]['first'])
-                    tmp_g[u][v]['reasons'] = json.dumps(g[u][v]['reasons'])
-            nx.write_graphml(tmp_g, fn)
+            import graphml
+
+            started = time.perf_counter()
+            graphml.write_graphml(g, fn, dict(first_proportion=first_proportions(g)))
+            self.metrics.time('write_g', started)
             log(f'Wrote g (V={g.number_of_nodes():,},E={g.number_of_edges():,}) to {fn}', verbose)
 
+    def throttle(self, batch, start_w_ts):
+        # stops a single hot target (e.g., a trending hashtag) making the pair
+        # enumeration in process() explode, by capping, sampling or skipping
+        # the events of any target with more than max_target_events in the window
+        max_events = self.cfg['max_target_events']
+        if max_events < 0:
+            return batch
+
+        buckets = {}
+        for i, e in enumerate(batch):
+            tgt = e['tgt'] if self.cfg['comparison_strategy'] == 'EXACT_MATCH' else str(e['tgt']).lower()
+            buckets.setdefault(tgt, []).append(i)
+
+        overflow = self.cfg['target_overflow']
+        dropped = set()
+        scales = {}
+        for tgt, ixs in buckets.items():
+            n = len(ixs)
+            if n <= max_events:
+                continue
+            if overflow == 'SKIP':
+                kept = []
+            elif overflow == 'CAP':
+                kept = ixs[:max_events]
+            else:  # overflow == 'SAMPLE'
+                kept = self.rnd.sample(ixs, max_events)
+                # each sampled pair stands in for n(n-1) / k(k-1) of the original pairs
+                k = max_events
+                scale = (n * (n - 1)) / (k * (k - 1)) if k > 1 else 1.0
+                for i in kept:
+                    scales[i] = scale
+            dropped.update(set(ixs).difference(kept))
+
+            stats = self.throttled.setdefault(tgt, dict(windows=0, events_seen=0, events_kept=0, first_window=ts_s(start_w_ts)))
+            stats['windows'] += 1
+            stats['events_seen'] += n
+            stats['events_kept'] += len(kept)
+            log(f'Throttled target "{tgt}": kept {len(kept):,} of {n:,} events ({overflow})')
+
+        if not dropped and not scales:
+            return batch
+
+        self.metrics.count('events_throttled', len(dropped))
+        return [
+            dict(e, scale=scales[i]) if i in scales else e
+            for i, e in enumerate(batch) if i not in dropped
+        ]
+
+    def write_throttled(self):
+        if not self.throttled:
+            return
+        log(f'Throttled {len(self.throttled):,} hot target(s)', OVERRIDE)
+        if self.cfg['dry_run']:
+            return
+        fn = f'{self.cfg["out_filebase"]}-throttled.csv'
+        with open(fn, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['target', 'windows', 'events_seen', 'events_kept', 'first_window'])
+            for tgt, stats in sorted(self.throttled.items(), key=lambda item: -item[1]['events_seen']):
+                writer.writerow([tgt, stats['windows'], stats['events_seen'], stats['events_kept'], stats['first_window']])
+        log(f'Wrote throttled targets to {fn}', OVERRIDE)
+
     def process_batch(self, end_w_ts, queue, g, d1_end_ts=None):
         # set the window over which we're operating
         start_w_ts = end_w_ts - self.cfg['d2']
         if not d1_end_ts:
             d1_end_ts = start_w_ts + self.cfg['d1']
 
+        if self.queue_spiller != None and self.queue_spiller.spilled:
+            return self.process_spilled_batch(start_w_ts, d1_end_ts, queue, g)
+
         # what's the time span of the queue?
-        log(f'Queue {len(queue)} events in {(queue[-1]["ts"] - queue[0]["ts"]) / (60):.1f} minutes')
+        log(f'Queue {len(queue)} events in {queue_minutes(queue):.1f} minutes')
         # for e in queue:
         #     log(f'{ts_s(e["ts"])} {e["tgt"]}')
 
         # only process the current window's worth, because the last event that
         # occurred may have been way beyond the previous events
+        started = time.perf_counter()
         queue = self.drop_before(queue, start_w_ts)
-        log(f'-> Queue {len(queue)} events in {(queue[-1]["ts"] - queue[0]["ts"]) / (60):.1f} minutes')
+        self.metrics.time('drop_before', started)
+        log(f'-> Queue {len(queue)} events in {queue_minutes(queue):.1f} minutes')
 
         if len(queue) >= 2:  # guard clause
-            g = self.process(queue, d1_end_ts, g, self.cfg['comparison_strategy'], self.cfg['keep_history'])
+            batch = self.throttle(queue, start_w_ts)
+            started = time.perf_counter()
+            g = self.process(batch, d1_end_ts, g, self.cfg['comparison_strategy'], self.history != None)
+            self.metrics.time('process', started)
         queue = self.drop_before(queue, start_w_ts)  # drop t0 - d1 now
 
         return (d1_end_ts, queue, g)
 
+    def process_spilled_batch(self, start_w_ts, d1_end_ts, queue, g):
+        # as for process_batch, but one target partition of the queue at a time
+        retained = 0
+        for p, events in self.queue_spiller.partitions(queue):
+            started = time.perf_counter()
+            events = self.drop_before(events, start_w_ts)
+            self.metrics.time('drop_before', started)
+            if len(events) >= 2:
+                batch = self.throttle(events, start_w_ts)
+                started = time.perf_counter()
+                g = self.process(batch, d1_end_ts, g, self.cfg['comparison_strategy'], self.history != None)
+                self.metrics.time('process', started)
+            self.queue_spiller.replace(p, events)
+            retained += len(events)
+
+        queue = []
+        if retained * spill.EVENT_BYTES <= self.cfg['max_memory'] / 4:
+            queue = self.queue_spiller.unspill()
+            log(f'Read {len(queue):,} queued events back from disk')
+
+        return (d1_end_ts, queue, g)
+
+    def enforce_memory_budget(self, g, queue):
+        # spills the queue or the CN's edges when over the --max-memory budget
+        if self.spill_dir == None:
+            return
+        max_memory = self.cfg['max_memory']
+        if self.queue_spiller != None and len(queue) * spill.EVENT_BYTES > max_memory / 2:
+            self.metrics.count('events_spilled', len(queue))
+            log(f'Spilling {len(queue):,} queued events to disk')
+            self.queue_spiller.spill(queue)
+        if self.edge_spiller != None and spill.estimate_bytes(g, queue) > max_memory and g.number_of_edges() > 0:
+            log(f'Spilling {g.number_of_edges():,} edges to disk')
+            self.metrics.count('edges_spilled', self.edge_spiller.spill(g))
+
+    def merge_spilled_edges(self, g, now_ts):
+        # combines the spilled runs with g into the final CN, forgetting and
+        # filtering edges as they're merged to keep the result small
+        if self.edge_spiller == None or not self.edge_spiller.runs:
+            return g
+
+        log(f'Merging {len(self.edge_spiller.runs)} spilled edge run(s)', OVERRIDE)
+        decay_min_ew = self.cfg['decay_min_edge_weight']
+        min_ew = self.cfg['final_g_min_edge_weight']
+        merged_g = graph_from_edges(
+            (u, v, d) for u, v, d in self.edge_spiller.merged(g, self.decay)
+            if not self.decay.is_forgotten(d, now_ts, decay_min_ew) and d['weight'] >= min_ew
+        )
+        g.clear()
+        self.edge_spiller.cleanup()
+        return merged_g
+
+    def flush_edges(self, g):
+        # moves the window's (partially aggregated) edges into the edge store
+        if self.edge_store == None:
+            return g
+        started = time.perf_counter()
+        self.metrics.count('edges_stored', self.edge_store.upsert(g))
+        self.metrics.time('store', started)
+        g.clear()
+        return g
+
+    def final_edges(self, g, now_ts):
+        # returns g and the (u, v, edge_data) edges of the final CN, which are
+        # read back from the edge store if there is one
+        min_ew = self.cfg['final_g_min_edge_weight']
+        if self.edge_store != None:
+            g = self.flush_edges(g)
+            log(f'Reading {self.edge_store.number_of_edges():,} stored edges from {self.edge_store.fn}', OVERRIDE)
+            return g, self.edge_store.edges(now_ts if self.decay.enabled else None, min_ew)
+        g = self.filter_edges(g, min_ew)
+        return g, g.edges(data=True)
+
+    def final_graph(self, g, now_ts):
+        g, edges = self.final_edges(g, now_ts)
+        return graph_from_edges(edges) if self.edge_store != None else g
+
+    def write_final(self, g, fn, now_ts):
+        g, edges = self.final_edges(g, now_ts)
+
+        if self.cfg['export_format'] == 'NPZ':
+            if not self.cfg['dry_run']:
+                from edge_store import export_npz
+
+                n, m = export_npz(edges, fn)
+                log(f'Wrote g (V={n:,},E={m:,}) to {fn}', OVERRIDE)
+            return g
+
+        if self.edge_store != None:
+            g = graph_from_edges(edges)
+        self.write_g(g, fn, self.cfg['dry_run'], verbose=OVERRIDE)
+        return g
+
+    def write_hccs(self, g, now_ts):
+        # finds the final CN's highly coordinating communities on arrays,
+        # writing a row per node in one
+        import analysis
+        import numpy as np
+
+        started = time.perf_counter()
+        _, edges = self.final_edges(g, now_ts)
+        core, count, communities = analysis.hccs(analysis.from_edges(edges), self.cfg['hcc_k'], self.cfg['hcc_prune'])
+        sizes = np.bincount(communities, minlength=count).tolist()
+        with open(self.cfg['hccs_file'], 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['node', 'community', 'community_size'])
+            for c, n in sorted(zip(communities.tolist(), core.nodes)):
+                writer.writerow([n, c, sizes[c]])
+        self.metrics.time('hccs', started)
+        log(f'Wrote {count:,} HCCs of {core.number_of_nodes():,} nodes to {self.cfg["hccs_file"]}', OVERRIDE)
+
     def filter_edges(self, g, min_ew):
         if min_ew < 0:
             return g
@@ -441,75 +1209,321 @@ class BatchManager:
         return g
 
 
+    def report_metrics(self):
+        summary = self.metrics.summary()
+        log('Summary: ' + ', '.join(f'{k}={v:,.1f}' if isinstance(v, float) else f'{k}={v:,}' for k, v in summary.items()), OVERRIDE)
+        for allocation in self.metrics.top_allocations():
+            log(f'Allocated: {allocation}')
+        if self.cfg['metrics_file']:
+            self.metrics.write(self.cfg['metrics_file'])
+            log(f'Wrote metrics for {summary["windows"]} windows to {self.cfg["metrics_file"]}', OVERRIDE)
+
     def mkfn(self, ts, final=False):
         tag = 'FINAL' if final else f'{ts_s(ts)}'
         extract_what = f'-{self.cfg["extract_what"]}' if self.cfg["extract_what"] else ''
-        return f'{self.cfg["out_filebase"]}{extract_what}-{tag}.graphml'
-
-    def run(self):
-        if self.cfg['raw_data'] == 'TWEETS':
-            extractor = TweetExtractor(self.cfg['extract_what'], self.cfg['exclude_targets'])
-        else:  # csv input
-            params = [self.cfg[k] for k in ['id_col', 'ts_col', 'src_col', 'tgt_col', 'exclude_targets']]
-            extractor = CsvExtractor(*params)
+        ext = 'npz' if final and self.cfg['export_format'] == 'NPZ' else 'graphml'
+        if ext == 'graphml' and self.cfg['gzip']:
+            ext += '.gz'
+        return f'{self.cfg["out_filebase"]}{extract_what}-{tag}.{ext}'
+
+    def open_stores(self):
+        # the on-disk structures the config asks for
+        if self.cfg['keep_history'] and not self.cfg['dry_run']:
+            from history import HistoryTable
+
+            self.history = HistoryTable(self.cfg['out_filebase'], self.cfg['history_chunk_size'])
+
+        if self.cfg['edge_store']:
+            from edge_store import SqliteEdgeStore
+
+            self.edge_store = SqliteEdgeStore(self.cfg['edge_store'], self.decay)
+        elif self.cfg['top_pairs'] > 0:
+            from top_pairs import TopPairs
+
+            self.edge_store = TopPairs(self.cfg['top_pairs'], self.cfg['top_pairs_width'])
+
+        if self.cfg['max_memory'] > 0:
+            self.spill_dir = spill.make_work_dir(self.cfg['out_filebase'])
+            if self.edge_store == None:  # the store already keeps edges on disk
+                self.edge_spiller = spill.EdgeSpiller(self.spill_dir)
+            if self.cfg['comparison_strategy'] != 'TEXT_SIMILARITY':
+                self.queue_spiller = spill.QueueSpiller(
+                    self.spill_dir, 64, self.cfg['comparison_strategy'] == 'CASE_INSENSITIVE'
+                )
 
-        in_f = None
+    def close_stores(self):
+        if self.edge_spiller != None:
+            self.edge_spiller.cleanup()
+        if self.spill_dir != None:
+            spill.remove_work_dir(self.spill_dir)
+            self.spill_dir = None
+        if self.edge_store != None:
+            self.edge_store.close()
+        if self.history != None:
+            chunk_files = self.history.close()
+            log(f'Wrote {len(self.history):,} history rows to {len(chunk_files)} file(s)', OVERRIDE)
+
+    def extracted(self, reader, extractor):
+        # yields the (non-empty) list of events extracted from each line of the input
+        definitely_no_interaction_column = False  # used to short circuit further tests
+        line_count = 0
+        for line in reader:
+            line_count = utils.log_row_count(line_count, OVERRIDE)
+            self.metrics.count('events_read')
+
+            started = time.perf_counter()
+            extractions = extractor.extract(line)
+            self.metrics.time('extract', started)
+            self.metrics.count('extractions', len(extractions))
+            if len(extractions) == 0:
+                continue
+            kept = extractor.prefiltered(extractions)
+            if len(kept) < len(extractions):
+                self.metrics.count('events_prefiltered', len(extractions) - len(kept))
+                # a dropped post still moves the window along (see windows())
+                extractions = kept if kept else [dict(ts=extractions[0]['ts'])]
+
+            # look for the interaction (i.e. extract_what) if it hasn't been provided
+            if self.csv_mode and not definitely_no_interaction_column and not self.cfg['extract_what']:
+                if 'interaction' in line:
+                    self.cfg['extract_what'] = line['interaction']  # line is a csv row
+                else:
+                    definitely_no_interaction_column = True
+
+            yield extractions
+
+        log('\n', OVERRIDE)  # ends the line of progress dots
+
+    def windows(self, extraction_lists):
+        """Slides the window over time-ordered lists of simultaneous events
+        (e.g., those extracted from one post), yielding
+        (window start ts, window end ts, g, final) at the end of each window and
+        then, with final True, once the events are exhausted. Unless final_g_only
+        or dry_run is set, each window's g is a snapshot; otherwise it's the one
+        CN, updated in place. The final g is the CN before filtering (see
+        final_graph() and write_final())."""
+        import networkx as nx
+
+        self.open_stores()
         try:
-            in_f = self.open_file(self.cfg['in_file'])
-            reader = in_f
-            if self.csv_mode:
-                reader = csv.DictReader(in_f)
-
             queue = []
             g = nx.Graph()
             start_w_ts = -1
-            line_count = 0
-            definitely_no_interaction_column = False  # used to short circuit further tests
-            for line in reader:
-                line_count = utils.log_row_count(line_count, OVERRIDE)
-
-                extractions = extractor.extract(line)
-                if len(extractions) == 0:
-                    continue
-
+            window_count = 0
+            if self.resumed != None:
+                queue, g, start_w_ts, window_count = [self.resumed[k] for k in ['queue', 'g', 'start_w_ts', 'window_count']]
+                self.resumed = None
+                log(f'Carrying on from {ts_s(start_w_ts)} with {len(queue):,} queued events and {g.number_of_edges():,} edges', OVERRIDE)
+            curr_ts = start_w_ts
+            for extractions in extraction_lists:
+                curr_ts = extractions[0]['ts']
                 if start_w_ts == -1:
-                    start_w_ts = extractions[0]['ts']
+                    start_w_ts = curr_ts
                     log(f'First timestamp: {ts_s(start_w_ts)}')
-                curr_ts = extractions[0]['ts']
-
-                # look for the interaction (i.e. extract_what) if it hasn't been provided
-                if self.csv_mode and not definitely_no_interaction_column and not self.cfg['extract_what']:
-                    if 'interaction' in line:
-                        self.cfg['extract_what'] = line['interaction']  # line is a csv row
-                    else:
-                        definitely_no_interaction_column = True
 
                 if curr_ts > start_w_ts + self.cfg['d2']: # end of curr window
                     # print('end of window')
-                    fn = self.mkfn(start_w_ts)
+                    window_start_ts = start_w_ts
                     d2_end_ts = start_w_ts + self.cfg['d2']
                     start_w_ts, queue, g = self.process_batch(d2_end_ts, queue, g)
-                    self.write_g(g, fn, self.cfg['dry_run'] or self.cfg['final_g_only'], keep_history=self.cfg['keep_history'])
-
-                # add the current extractions
+                    window_count += 1
+                    writing_g = not (self.cfg['dry_run'] or self.cfg['final_g_only'])
+                    if writing_g or window_count % self.cfg['decay_prune_every'] == 0:
+                        # not beyond the new window's start, as its pairs may
+                        # still keep edges alive
+                        g = self.forget_edges(g, start_w_ts)
+                    g = self.flush_edges(g)
+                    self.enforce_memory_budget(g, queue)
+                    yield window_start_ts, d2_end_ts, g, False
+                    self.metrics.end_window(ts_s(d2_end_ts - self.cfg['d2']), len(queue), g)
+
+                # add the current extractions (bar any with no target, which
+                # only stand in for a post dropped by the prefilter)
                 for e in extractions:
-                    queue.append(e)
-
-                log(f'[{ts_s(curr_ts)}] Queue size: {len(queue)}, lines read: {line_count}, extractions: {len(extractions)}')
-
-            log('\n', OVERRIDE)
-
-            fn = self.mkfn(start_w_ts, final=True)
+                    if 'tgt' in e:
+                        queue.append(e)
+                self.metrics.saw_queue(len(queue))
+                if self.queue_spiller != None and len(queue) * spill.EVENT_BYTES > self.cfg['max_memory'] / 2:
+                    g = self.flush_edges(g)
+                    self.enforce_memory_budget(g, queue)
+
+            if start_w_ts == -1:
+                log('No events', OVERRIDE)
+                return
+
+            if self.cfg['save_state']:
+                # before the final window, which is cut short
+                self.save_state(queue, g, start_w_ts, window_count)
+
+            window_start_ts = start_w_ts
             # use up the entire window, given we're at the end
-            last_ts = queue[-1]["ts"]
+            last_ts = queue[-1]["ts"] if queue else curr_ts
             log(f'Last timestamp: {ts_s(last_ts)}')
             start_w_ts, queue, g = self.process_batch(start_w_ts + self.cfg['d2'], queue, g, last_ts)
-            self.write_g(self.filter_edges(g, self.cfg['final_g_min_edge_weight']), fn, self.cfg['dry_run'], keep_history=self.cfg['keep_history'], verbose=OVERRIDE)
+            g = self.forget_edges(g, last_ts)
+            g = self.merge_spilled_edges(g, last_ts)
+            yield window_start_ts, last_ts, g, True
+            self.metrics.end_window('FINAL', len(queue), g)
+
+        finally:
+            self.close_stores()
+
+    def run(self):
+        if self.cfg['append_to']:
+            error = self.load_state(self.cfg['append_to'])
+            if error:
+                print(error)
+                return
+
+        if self.cfg['raw_data'] == 'TWEETS':
+            extractor = TweetExtractor(
+                self.cfg['extract_what'], self.cfg['exclude_targets'],
+                self.cfg['entity_cache_size'], self.metrics
+            )
+        else:  # csv input
+            params = [self.cfg[k] for k in ['id_col', 'ts_col', 'src_col', 'tgt_col', 'exclude_targets']]
+            extractor = CsvExtractor(*params)
+
+        if self.cfg['prefilter']:
+            extractor.prefilter = self.first_pass(extractor)
+
+        in_f = None
+        try:
+            in_f = self.open_file(self.cfg['in_file'])
+            reader = in_f
+            if self.csv_mode:
+                reader = csv.DictReader(in_f)
+
+            for start_w_ts, end_w_ts, g, final in self.windows(self.extracted(reader, extractor)):
+                if final:
+                    g = self.write_final(g, self.mkfn(start_w_ts, final=True), end_w_ts)
+                    if self.cfg['hccs_file'] and not self.cfg['dry_run']:
+                        self.write_hccs(g, end_w_ts)
+                else:
+                    self.write_g(g, self.mkfn(start_w_ts), self.cfg['dry_run'] or self.cfg['final_g_only'])
+            self.write_throttled()
+            self.report_metrics()
 
         finally:
             if in_f: in_f.close()
 
 
+    def save_state(self, queue, g, start_w_ts, window_count):
+        # what windows() needs to carry on where it left off, with the
+        # options that would change the CN if they changed
+        state = dict(
+            options={ k : self.cfg[k] for k in BatchManager.STATE_OPTIONS },
+            queue=queue,
+            g=g,
+            start_w_ts=start_w_ts,
+            window_count=window_count,
+            rnd=self.rnd.getstate(),
+            throttled=self.throttled
+        )
+        with gzip.open(self.cfg['save_state'], 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        log(f'Saved the state at {ts_s(start_w_ts)} to {self.cfg["save_state"]}', OVERRIDE)
+
+    def load_state(self, fn):
+        # carries on from a --save-state file, returning a description of why
+        # it can't be, or None
+        with gzip.open(fn, 'rb') as f:
+            state = pickle.load(f)
+        if self.cfg['extract_what'] == None:
+            # the saving run may have found it in the input, see extracted()
+            self.cfg['extract_what'] = state['options']['extract_what']
+        for k, v in state['options'].items():
+            if self.cfg[k] != v:
+                return f'{fn} was saved with {k} = {v!r}, not {self.cfg[k]!r}'
+        self.rnd.setstate(state['rnd'])
+        self.throttled = state['throttled']
+        self.resumed = state
+        return None
+
+    def first_pass(self, extractor):
+        # sketches which accounts use each target, for the prefilter
+        from sketch import SourceSketch
+
+        if self.cfg['comparison_strategy'] == 'TEXT_SIMILARITY':
+            log('The prefilter only supports EXACT_MATCH and CASE_INSENSITIVE, not filtering', OVERRIDE)
+            return None
+
+        target_key = None
+        if self.cfg['comparison_strategy'] == 'CASE_INSENSITIVE':
+            target_key = lambda tgt: str(tgt).lower()
+        prefilter = SourceSketch(self.cfg['prefilter_buckets'], target_key)
+        log('Prefilter pass', OVERRIDE)
+        # where the final window starts, as windows() will move it along
+        start_w_ts = self.resumed['start_w_ts'] if self.resumed != None else -1
+        with self.open_file(self.cfg['in_file']) as in_f:
+            reader = csv.DictReader(in_f) if self.csv_mode else in_f
+            line_count = 0
+            for line in reader:
+                line_count = utils.log_row_count(line_count, OVERRIDE)
+                extractions = extractor.extract(line)
+                for e in extractions:
+                    prefilter.add(e['tgt'], e['src'])
+                if len(extractions) > 0:
+                    if start_w_ts == -1:
+                        start_w_ts = extractions[0]['ts']
+                    elif extractions[0]['ts'] > start_w_ts + self.cfg['d2']:
+                        start_w_ts += self.cfg['d1']
+        if self.cfg['save_state'] and start_w_ts != -1:
+            # the final window's events are saved in the queue, and may match
+            # those of the input appended to it
+            extractor.keep_from_ts = start_w_ts
+        # the entity cache's hit rate is for the main pass
+        self.metrics.reset('entity_cache_hits', 'entity_cache_misses')
+        if self.resumed != None:  # the new input may match the queued events
+            for e in self.resumed['queue']:
+                prefilter.add(e['tgt'], e['src'])
+        log('\n', OVERRIDE)
+        used, kept = prefilter.counts()
+        log(f'Prefilter keeps the targets of {kept:,} of the {used:,} buckets used (of {prefilter.buckets:,})', OVERRIDE)
+        return prefilter
+
+
+def queue_minutes(queue):
+    # the queue may be empty if the prefilter has dropped its events
+    return (queue[-1]['ts'] - queue[0]['ts']) / 60 if queue else 0.0
+
+
+def graph_from_edges(edges):
+    # builds a CN from (u, v, edge_data) tuples
+    import networkx as nx
+
+    g = nx.Graph()
+    for u, v, d in edges:
+        g.add_node(u, label=u)
+        g.add_node(v, label=v)
+        g.add_edge(u, v, **d)
+    return g
+
+
+def first_proportions(g):
+    # the mean 'first' count over each node's adjacent edges, in g.nodes() order
+    import numpy as np
+
+    n_ix = { n : i for i, n in enumerate(g.nodes()) }
+    m = g.number_of_edges()
+    lesser = np.empty(m, dtype=np.int64)
+    greater = np.empty(m, dtype=np.int64)
+    first_u = np.empty(m, dtype=np.float64)
+    first_v = np.empty(m, dtype=np.float64)
+    for i, (u, v, d) in enumerate(g.edges(data=True)):
+        if u > v:
+            u, v = v, u
+        lesser[i] = n_ix[u]
+        greater[i] = n_ix[v]
+        first_u[i] = d['first_u']
+        first_v[i] = d['first_v']
+
+    n = len(n_ix)
+    totals = np.bincount(lesser, first_u, n) + np.bincount(greater, first_v, n)
+    degrees = np.bincount(lesser, minlength=n) + np.bincount(greater, minlength=n)
+    return np.divide(totals, degrees, out=np.zeros(n), where=degrees > 0).tolist()
+
+
 def parse_ts(ts_str):
     return utils.extract_ts_s(ts_str)
 
@@ -531,22 +1545,15 @@ def convert_to_secs(t_str):
         return int(t_str[:-1]) if t_str[-1] in 'sS' else int(t_str) # seconds
 
 
-DEBUG=False
-OVERRIDE=True
-def log(msg, override=False):
-    if DEBUG or override: utils.eprint('[%s] %s' % (utils.now_str(), msg))
-
-
-if __name__=='__main__':
-
-    options = Options()
-    opts = options.parse(sys.argv[1:])
-
-    DEBUG=opts.verbose
+def convert_to_bytes(m_str):
+    units = { 'k' : 1024, 'm' : 1024 ** 2, 'g' : 1024 ** 3 }
+    if m_str[-1].lower() in units:
+        return int(float(m_str[:-1]) * units[m_str[-1].lower()])
+    else:
+        return int(m_str)  # bytes
 
-    start_time = time.time()
-    log('Starting', OVERRIDE)
 
+def config_from(opts):
     cfg = dict(
         in_file = opts.interactions_file,
         out_filebase = opts.out_filebase,
@@ -563,20 +1570,90 @@ if __name__=='__main__':
         src_col = opts.source_column,
         tgt_col = opts.target_column,
         keep_history = opts.keep_history,
+        history_chunk_size = opts.history_chunk_size,
         comparison_strategy = opts.comparison_strategy,
         text_similarity_threshold = opts.text_similarity_threshold,
-        text_similarity_min_tokens = opts.text_similarity_min_tokens
+        text_similarity_min_tokens = opts.text_similarity_min_tokens,
+        decay_strategy = opts.decay_strategy,
+        decay_period = convert_to_secs(opts.decay_period_arg),
+        decay_min_edge_weight = opts.decay_min_edge_weight,
+        decay_prune_every = max(1, opts.decay_prune_every),
+        max_target_events = opts.max_target_events,
+        target_overflow = opts.target_overflow,
+        max_memory = convert_to_bytes(opts.max_memory_arg) if opts.max_memory_arg else -1,
+        edge_store = opts.edge_store,
+        top_pairs = opts.top_pairs,
+        top_pairs_width = opts.top_pairs_width,
+        entity_cache_size = opts.entity_cache_size,
+        prefilter = opts.prefilter,
+        save_state = opts.save_state,
+        append_to = opts.append_to,
+        prefilter_buckets = opts.prefilter_buckets,
+        engine = opts.engine,
+        export_format = opts.export_format,
+        gzip = opts.gzip,
+        hccs_file = opts.hccs_file,
+        hcc_prune = opts.hcc_prune,
+        hcc_k = opts.hcc_k,
+        metrics_file = opts.metrics_file,
+        trace_memory = opts.trace_memory
     )
 
     # default is for no sliding windows (i.e., adjacent windows)
     if cfg['d2'] == -1:
         cfg['d2'] = cfg['d1']
+    return cfg
+
 
+def config_error(cfg):
+    # a description of what's wrong with cfg, or None
     if cfg['d1'] > cfg['d2']:
-        print(f'Delta 1 ({opts.d1_arg}) cannot be greater than delta 2 ({opts.d2_arg})')
+        return f'Delta 1 ({cfg["d1"]}s) cannot be greater than delta 2 ({cfg["d2"]}s)'
+    elif cfg['max_memory'] > 0 and not (cfg['final_g_only'] or cfg['dry_run']):
+        return 'A memory budget (--max-memory) requires --final-g-only, as spilled edges are only merged into the final CN'
+    elif cfg['edge_store'] and not cfg['final_g_only']:
+        return 'An edge store (--edge-store) requires --final-g-only, as stored edges are only read back for the final CN'
+    elif (cfg['save_state'] or cfg['append_to']) and (cfg['edge_store'] or cfg['top_pairs'] > 0 or cfg['max_memory'] > 0 or cfg['keep_history']):
+        return 'Saved states (--save-state, --append-to) only cover CNs held in memory, without history'
+    elif cfg['top_pairs'] > 0 and not cfg['final_g_only']:
+        return 'The top pairs (--top-pairs) require --final-g-only, as they are only estimated for the final CN'
+    elif cfg['top_pairs'] > 0 and (cfg['edge_store'] or cfg['keep_history'] or cfg['decay_strategy'] != 'NONE'):
+        return 'The top pairs (--top-pairs) cannot be kept with an edge store, history or decay'
+    return None
+
+
+DEBUG=False
+OVERRIDE=True
+def log(msg, override=False):
+    if DEBUG or override: utils.eprint('[%s] %s' % (utils.now_str(), msg))
+
+
+if __name__=='__main__':
+
+    options = Options()
+    opts = options.parse(sys.argv[1:])
+
+    DEBUG=opts.verbose
+
+    start_time = time.time()
+    log('Starting', OVERRIDE)
+
+    cfg = config_from(opts)
+
+    err = config_error(cfg)
+    if err:
+        print(err)
     else:
         mgr = BatchManager(cfg)
-        mgr.run()
+        if opts.profile_file:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.runcall(mgr.run)
+            profiler.dump_stats(opts.profile_file)
+            log(f'Wrote profile to {opts.profile_file} (view with: python -m pstats {opts.profile_file})', OVERRIDE)
+        else:
+            mgr.run()
 
     duration = time.time() - start_time
     log(f'DONE having taken {duration:.1f} seconds', OVERRIDE)
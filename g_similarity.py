@@ -1,7 +1,12 @@
-import networkx as nx
+import analysis
+import glob
+import numpy as np
 import sys
+import utils
 
 from argparse import ArgumentParser
+from itertools import combinations
+from multiprocessing import Pool
 
 
 class Options:
@@ -9,21 +14,42 @@ class Options:
         self._init_parser()
 
     def _init_parser(self):
-        usage = 'filter_by_edge_weight.py -i <in.graphml> -o <out.graphml> -mw <weight> [--dry-run]'
+        usage = 'g_similarity.py (-g1 <g1.graphml> -g2 <g2.graphml> | -g <graphml files or globs>...) [-o <out.csv>] [--header]'
 
         self.parser = ArgumentParser(usage=usage)
         self.parser.add_argument(
             '-g1',
-            required=True,
+            required=False,
             dest='g1_file',
             help='A network (graphml)'
         )
         self.parser.add_argument(
             '-g2',
-            required=True,
+            required=False,
             dest='g2_file',
             help='A network (graphml)'
         )
+        self.parser.add_argument(
+            '-g', '--graphs',
+            nargs='+',
+            default=[],
+            dest='graph_files',
+            help='Networks (graphml) or globs of them, to compare every pair of (instead of -g1 and -g2)'
+        )
+        self.parser.add_argument(
+            '-o',
+            required=False,
+            default=None,
+            dest='out_file',
+            help='Where to write the CSV (default: stdout)'
+        )
+        self.parser.add_argument(
+            '-p', '--processes',
+            type=int,
+            default=None,
+            dest='processes',
+            help='Number of processes loading networks (default: number of cores)'
+        )
         self.parser.add_argument(
             '--header',
             dest='header',
@@ -43,18 +69,73 @@ class Options:
         return self.parser.parse_args(args)
 
 
-def jaccard(g1, g2):
-    g1_nodes = set(g1.nodes())
-    g2_nodes = set(g2.nodes())
+HEADER = 'G1,G2,G1 nodes,G2 nodes,Jaccard,Overlap,G1 (LC) nodes,G2 (LC) nodes,Jaccard (LC),Overlap (LC)'
+
+
+def jaccard(g1_nodes, g2_nodes):
+    # node sets as sorted, unique integer arrays
+    intersection = len(np.intersect1d(g1_nodes, g2_nodes, assume_unique=True))
+    union = len(g1_nodes) + len(g2_nodes) - intersection
+    return intersection / union if union > 0 else float('nan')
+
+
+def overlap(g1_nodes, g2_nodes):
+    intersection = len(np.intersect1d(g1_nodes, g2_nodes, assume_unique=True))
+    smaller = min(len(g1_nodes), len(g2_nodes))
+    return intersection / smaller if smaller > 0 else float('nan')
+
+
+def load_node_sets(gfn):
+    # runs in a worker process: the node ids of a network and its largest component
+    g = analysis.read_graph(gfn)
+    lc = g.largest_component()
+    return gfn, g.nodes, lc.nodes
+
+
+def load_all(gfns, processes=None):
+    """Loads each network once, in parallel, returning a map from file name
+    to the sorted integer arrays (ids interned across all the networks) of
+    its nodes and largest component's nodes."""
+    interned = {}
+    def intern(nodes):
+        return np.unique(np.fromiter(
+            (interned.setdefault(n, len(interned)) for n in nodes), dtype=np.int64, count=len(nodes)
+        ))
 
-    return len(g1_nodes.intersection(g2_nodes)) / len(g1_nodes.union(g2_nodes))
+    node_sets = {}
+    with Pool(processes) as pool:
+        for gfn, nodes, lc_nodes in pool.imap_unordered(load_node_sets, gfns):
+            node_sets[gfn] = (intern(nodes), intern(lc_nodes))
+            log(f'Loaded {gfn}: {len(nodes):,} nodes ({len(lc_nodes):,} in largest component)')
+    return node_sets
 
 
-def overlap(g1, g2):
-    g1_nodes = set(g1.nodes())
-    g2_nodes = set(g2.nodes())
+def similarity_row(gfn1, gfn2, node_sets):
+    g1, g1lc = node_sets[gfn1]
+    g2, g2lc = node_sets[gfn2]
+    # overlap always ought to be 1
+    return ','.join([
+        f'{gfn1}',
+        f'{gfn2}',
+        f'{len(g1)}',
+        f'{len(g2)}',
+        f'{jaccard(g1, g2)}',
+        f'{overlap(g1, g2)}',
+        f'{len(g1lc)}',
+        f'{len(g2lc)}',
+        f'{jaccard(g1lc, g2lc)}',
+        f'{overlap(g1lc, g2lc)}'
+    ])
+
 
-    return len(g1_nodes.intersection(g2_nodes)) / min(len(g1_nodes), len(g2_nodes))
+def expand(patterns):
+    # expands globs, keeping the given order and dropping repeats
+    gfns = []
+    for p in patterns:
+        for gfn in sorted(glob.glob(p)) or [p]:
+            if gfn not in gfns:
+                gfns.append(gfn)
+    return gfns
 
 
 DEBUG=False
@@ -70,28 +151,25 @@ if __name__=='__main__':
 
     DEBUG=opts.verbose
 
-    g1 = nx.read_graphml(opts.g1_file)
-    g2 = nx.read_graphml(opts.g2_file)
-
-    # g1_components = list(nx.connected_components(g1))
-    # g1lc = g.subgraph(max(components, key=len))
-
-    g1lc = g1.subgraph(max(nx.connected_components(g1), key=len))
-    g2lc = g2.subgraph(max(nx.connected_components(g2), key=len))
-
-    # overlap always ought to be 1
-    if opts.header:
-        print('G1,G2,G1 nodes,G2 nodes,Jaccard,Overlap,G1 (LC) nodes,G2 (LC) nodes,Jaccard (LC),Overlap (LC)')
-
-    print(','.join([
-        f'{opts.g1_file}',
-        f'{opts.g2_file}',
-        f'{g1.number_of_nodes()}',
-        f'{g2.number_of_nodes()}',
-        f'{jaccard(g1, g2)}',
-        f'{overlap(g1, g2)}',
-        f'{g1lc.number_of_nodes()}',
-        f'{g2lc.number_of_nodes()}',
-        f'{jaccard(g1lc, g2lc)}',
-        f'{overlap(g1lc, g2lc)}'
-    ]))
+    if opts.graph_files:
+        gfns = expand(opts.graph_files)
+        pairs = list(combinations(gfns, 2))
+    elif opts.g1_file and opts.g2_file:
+        gfns = [opts.g1_file, opts.g2_file]
+        pairs = [(opts.g1_file, opts.g2_file)]
+    else:
+        options.parser.error('Provide either -g1 and -g2, or -g')
+
+    # each network is only read once, however many pairs it's in
+    node_sets = load_all(gfns, min(opts.processes or len(gfns), len(gfns)))
+
+    out_f = open(opts.out_file, 'w', encoding='utf-8') if opts.out_file else sys.stdout
+    try:
+        if opts.header:
+            print(HEADER, file=out_f)
+        for gfn1, gfn2 in pairs:
+            print(similarity_row(gfn1, gfn2, node_sets), file=out_f)
+    finally:
+        if opts.out_file: out_f.close()
+
+    log(f'Compared {len(pairs):,} pairs of {len(gfns)} networks')
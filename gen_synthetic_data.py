@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+import random
+import sys
+import time
+import utils
+
+from argparse import ArgumentParser
+from itertools import accumulate
+
+# Generates reproducible synthetic interactions (CSV) and/or raw tweets (JSONL)
+# for benchmarking, with Zipfian target popularity, injected coordinating
+# cliques and bursts of activity on single targets
+
+class Options:
+    def __init__(self):
+        self._init_parser()
+
+    def _init_parser(self):
+        usage = 'gen_synthetic_data.py [-o <interactions>.csv] [-t <tweets>.jsonl] -n <events> [options]'
+
+        self.parser = ArgumentParser(usage=usage)
+        self.parser.add_argument(
+            '-o', '--csv-out',
+            dest='csv_file',
+            default=None,
+            help='Where to write interactions as CSV (default: None)'
+        )
+        self.parser.add_argument(
+            '-t', '--tweets-out',
+            dest='tweets_file',
+            default=None,
+            help='Where to write raw tweets as JSONL (default: None)'
+        )
+        self.parser.add_argument(
+            '-n', '--events',
+            dest='events',
+            type=int,
+            default=10000,
+            help='Number of background events (default: 10000)'
+        )
+        self.parser.add_argument(
+            '--accounts',
+            dest='accounts',
+            type=int,
+            default=1000,
+            help='Number of background accounts (default: 1000)'
+        )
+        self.parser.add_argument(
+            '--targets',
+            dest='targets',
+            type=int,
+            default=500,
+            help='Number of distinct targets (default: 500)'
+        )
+        self.parser.add_argument(
+            '--zipf',
+            dest='zipf_exponent',
+            type=float,
+            default=1.1,
+            help='Exponent of the Zipfian target popularity (default: 1.1)'
+        )
+        self.parser.add_argument(
+            '--duration',
+            dest='duration_arg',
+            default='1d',
+            help='Time span of the data, value + unit, e.g. 10s = 10 seconds (m=mins, h=hr, d=day, w=week) (default: 1d)'
+        )
+        self.parser.add_argument(
+            '--start-ts',
+            dest='start_ts',
+            type=int,
+            default=1577836800,
+            help='Epoch seconds of the first event (default: 1577836800, i.e., 2020-01-01)'
+        )
+        self.parser.add_argument(
+            '--cliques',
+            dest='cliques',
+            type=int,
+            default=5,
+            help='Number of injected coordinating cliques (default: 5)'
+        )
+        self.parser.add_argument(
+            '--clique-size',
+            dest='clique_size',
+            type=int,
+            default=10,
+            help='Accounts per clique (default: 10)'
+        )
+        self.parser.add_argument(
+            '--clique-actions',
+            dest='clique_actions',
+            type=int,
+            default=20,
+            help='Coordinated actions per clique, each by all members (default: 20)'
+        )
+        self.parser.add_argument(
+            '--clique-spread',
+            dest='clique_spread_arg',
+            default='1m',
+            help='Time span of each coordinated action (default: 1m)'
+        )
+        self.parser.add_argument(
+            '--bursts',
+            dest='bursts',
+            type=int,
+            default=2,
+            help='Number of bursts of activity on a single target (default: 2)'
+        )
+        self.parser.add_argument(
+            '--burst-size',
+            dest='burst_size',
+            type=int,
+            default=500,
+            help='Events per burst (default: 500)'
+        )
+        self.parser.add_argument(
+            '--burst-spread',
+            dest='burst_spread_arg',
+            default='10m',
+            help='Time span of each burst (default: 10m)'
+        )
+        self.parser.add_argument(
+            '--rt-prob',
+            dest='rt_prob',
+            type=float,
+            default=0.3,
+            help='Probability a raw tweet is a retweet of its target\'s original tweet (default: 0.3)'
+        )
+        self.parser.add_argument(
+            '--seed',
+            dest='seed',
+            type=int,
+            default=42,
+            help='Random seed (default: 42)'
+        )
+
+    def parse(self, args=None):
+        return self.parser.parse_args(args)
+
+
+WORDS = (
+    'the quick brown fox jumps over lazy dog vote now share this news truth '
+    'people must know about what they hide from you today election rally '
+    'watch live stream free speech join us together stop support'
+).split()
+
+
+def convert_to_secs(t_str):
+    return utils.parse_window_cli_arg(t_str if t_str[-1].isalpha() else t_str + 's')
+
+
+def target_text(rnd, target, words=12):
+    # a target's canonical text: similar (but not identical) for reuse of a target
+    return ' '.join([f'#{target}'] + rnd.sample(WORDS, words))
+
+
+def generate_events(cfg):
+    """Returns a list of (ts, src, tgt, text) tuples sorted by timestamp."""
+    rnd = random.Random(cfg['seed'])
+    start_ts = cfg['start_ts']
+    duration = cfg['duration']
+
+    targets = [f'tgt{i}' for i in range(cfg['targets'])]
+    cum_weights = list(accumulate(1.0 / (r ** cfg['zipf_exponent']) for r in range(1, len(targets) + 1)))
+    texts = { t : target_text(rnd, t) for t in targets }
+
+    events = []
+    # background activity
+    for ts, tgt in zip(
+        (rnd.randint(start_ts, start_ts + duration) for _ in range(cfg['events'])),
+        rnd.choices(targets, cum_weights=cum_weights, k=cfg['events'])
+    ):
+        events.append((ts, f'acct{rnd.randrange(cfg["accounts"])}', tgt, texts[tgt]))
+
+    # coordinating cliques: all members act on the same target at about the same time
+    for c in range(cfg['cliques']):
+        members = [f'clique{c}_{m}' for m in range(cfg['clique_size'])]
+        for a in range(cfg['clique_actions']):
+            tgt = f'clique{c}_tgt{a}'
+            text = target_text(rnd, tgt)
+            action_ts = rnd.randint(start_ts, start_ts + duration)
+            for m in members:
+                events.append((action_ts + rnd.randint(0, cfg['clique_spread']), m, tgt, text))
+
+    # bursts: many background accounts pile onto one popular target
+    for b in range(cfg['bursts']):
+        tgt = targets[b % len(targets)]
+        burst_ts = rnd.randint(start_ts, start_ts + duration)
+        for _ in range(cfg['burst_size']):
+            events.append((
+                burst_ts + rnd.randint(0, cfg['burst_spread']),
+                f'acct{rnd.randrange(cfg["accounts"])}', tgt, texts[tgt]
+            ))
+
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def write_csv(events, fn):
+    with open(fn, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['t_id', 'timestamp', 'source', 'target', 'text'])
+        for i, (ts, src, tgt, text) in enumerate(events):
+            writer.writerow([f'{i}', ts, src, tgt, text])
+
+
+def to_tweet(i, ts, src, tgt, text, rnd, rt_prob):
+    def entities(hashtag, url):
+        return dict(
+            hashtags=[{'text': hashtag}],
+            urls=[{'expanded_url': url}],
+            user_mentions=[{'id_str': f'm_{hashtag}', 'screen_name': f'm_{hashtag}'}]
+        )
+
+    tweet = {
+        'created_at': time.strftime(utils.TWITTER_TS_FORMAT.replace('%z', '+0000'), time.gmtime(ts)),
+        'id_str': f'{i}',
+        'user': {'id_str': src, 'screen_name': src},
+        'text': text,
+        'truncated': False,
+        'entities': entities(tgt, f'https://example.com/{tgt}')
+    }
+    if rnd.random() < rt_prob:
+        tweet['retweeted_status'] = {
+            'created_at': tweet['created_at'],
+            'id_str': f'ot_{tgt}',
+            'user': {'id_str': f'author_{tgt}', 'screen_name': f'author_{tgt}'},
+            'text': text,
+            'truncated': False,
+            'entities': entities(tgt, f'https://example.com/{tgt}')
+        }
+        tweet['text'] = f'RT @author_{tgt}: {text}'
+    elif i % 7 == 0:
+        tweet['in_reply_to_status_id_str'] = f'ot_{tgt}'
+        tweet['in_reply_to_user_id_str'] = f'author_{tgt}'
+    return tweet
+
+
+def write_tweets(events, fn, seed=42, rt_prob=0.3):
+    rnd = random.Random(seed)
+    with open(fn, 'w', encoding='utf-8') as f:
+        for i, (ts, src, tgt, text) in enumerate(events):
+            f.write(json.dumps(to_tweet(i, ts, src, tgt, text, rnd, rt_prob)))
+            f.write('\n')
+
+
+def config_from(opts):
+    return dict(
+        seed = opts.seed,
+        events = opts.events,
+        accounts = opts.accounts,
+        targets = opts.targets,
+        zipf_exponent = opts.zipf_exponent,
+        start_ts = opts.start_ts,
+        duration = convert_to_secs(opts.duration_arg),
+        cliques = opts.cliques,
+        clique_size = opts.clique_size,
+        clique_actions = opts.clique_actions,
+        clique_spread = convert_to_secs(opts.clique_spread_arg),
+        bursts = opts.bursts,
+        burst_size = opts.burst_size,
+        burst_spread = convert_to_secs(opts.burst_spread_arg)
+    )
+
+
+if __name__=='__main__':
+
+    options = Options()
+    opts = options.parse(sys.argv[1:])
+
+    if not (opts.csv_file or opts.tweets_file):
+        print('Nothing to do: provide -o and/or -t')
+        sys.exit(1)
+
+    events = generate_events(config_from(opts))
+
+    if opts.csv_file:
+        write_csv(events, opts.csv_file)
+        utils.logts(f'Wrote {len(events):,} interactions to {opts.csv_file}')
+    if opts.tweets_file:
+        write_tweets(events, opts.tweets_file, opts.seed, opts.rt_prob)
+        utils.logts(f'Wrote {len(events):,} tweets to {opts.tweets_file}')
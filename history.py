@@ -0,0 +1,89 @@
+import csv
+import glob
+import gzip
+import os
+
+from array import array
+
+
+def chunk_fn(filebase, chunk_number):
+    return f'{filebase}-history-{chunk_number:05d}.csv.gz'
+
+
+class HistoryTable:
+    """Append-only, columnar record of the co-activities behind each CN edge.
+
+    Rows are held in per-column arrays and spilled to disk as gzipped CSV
+    chunks whenever chunk_size rows have accumulated, so the audit trail for a
+    run costs a bounded amount of memory. Edges refer to their rows via the
+    integer 'history_id' stored on them in the graph. Any chunks left under
+    the same filebase by an earlier run are removed, as their edge ids would
+    collide with this run's.
+    """
+    COLUMNS = ['edge_id', 'ts', 'ut_id', 'vt_id', 'tgt', 'first_src']
+
+    def __init__(self, filebase, chunk_size=100000):
+        self.filebase = filebase
+        self.chunk_size = chunk_size
+        self.chunk_count = 0
+        self.row_count = 0
+        self.chunk_files = []
+        for fn in glob.glob(f'{glob.escape(filebase)}-history-[0-9][0-9][0-9][0-9][0-9].csv.gz'):
+            os.remove(fn)
+        self._reset()
+
+    def _reset(self):
+        self.edge_ids = array('q')
+        self.tss = array('q')
+        self.ut_ids = []
+        self.vt_ids = []
+        self.tgts = []
+        self.first_srcs = []
+
+    def __len__(self):
+        return self.row_count
+
+    def append(self, edge_id, ts, ut_id, vt_id, tgt, first_src):
+        self.edge_ids.append(edge_id)
+        self.tss.append(int(ts))
+        self.ut_ids.append(ut_id)
+        self.vt_ids.append(vt_id)
+        self.tgts.append(tgt)
+        self.first_srcs.append(first_src)
+        self.row_count += 1
+        if len(self.edge_ids) >= self.chunk_size:
+            self.spill()
+
+    def spill(self):
+        if len(self.edge_ids) == 0:
+            return
+        fn = chunk_fn(self.filebase, self.chunk_count)
+        with gzip.open(fn, 'wt', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(HistoryTable.COLUMNS)
+            writer.writerows(zip(
+                self.edge_ids, self.tss, self.ut_ids, self.vt_ids, self.tgts, self.first_srcs
+            ))
+        self.chunk_files.append(fn)
+        self.chunk_count += 1
+        self._reset()
+
+    def close(self):
+        self.spill()
+        return self.chunk_files
+
+
+def read_history(filebase, edge_ids=None):
+    """Yields the history rows (as dicts) written under filebase, optionally
+    only those of the given edge ids."""
+    if edge_ids is not None:
+        edge_ids = set(str(e) for e in edge_ids)
+    chunk_number = 0
+    fn = chunk_fn(filebase, chunk_number)
+    while os.path.exists(fn):
+        with gzip.open(fn, 'rt', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if edge_ids is None or row['edge_id'] in edge_ids:
+                    yield row
+        chunk_number += 1
+        fn = chunk_fn(filebase, chunk_number)
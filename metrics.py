@@ -0,0 +1,119 @@
+import csv
+import json
+import resource
+import time
+import tracemalloc
+
+
+def rss_mb():
+    """Current resident set size of this process in MB (peak RSS if the
+    current value isn't available on this platform)."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Metrics:
+    """Counters and stage timers for a coordination run, snapshotted per window.
+
+    Counters accumulate over the whole run; each window row reports the
+    increase since the previous window alongside gauges such as queue size
+    and RSS.
+    """
+    COUNTERS = [
+        'events_read', 'extractions', 'events_prefiltered', 'events_throttled', 'events_spilled',
+        'comparisons', 'matches', 'edges_created', 'edges_spilled', 'edges_stored',
+        'entity_cache_hits', 'entity_cache_misses'
+    ]
+    STAGES = ['extract', 'drop_before', 'process', 'store', 'write_g', 'hccs']
+    COLUMNS = (
+        ['window', 'wall_s'] + COUNTERS + [f'{s}_s' for s in STAGES] +
+        ['queue_size', 'queue_hwm', 'nodes', 'edges', 'rss_mb', 'traced_peak_mb']
+    )
+
+    def __init__(self, trace_memory=False):
+        self.counts = { c : 0 for c in Metrics.COUNTERS }
+        self.timings = { s : 0.0 for s in Metrics.STAGES }
+        self.queue_hwm = 0
+        self.windows = []
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.start_time = time.perf_counter()
+        self._last_window_time = self.start_time
+        self._last_counts = dict(self.counts)
+        self._last_timings = dict(self.timings)
+
+    def count(self, counter, n=1):
+        self.counts[counter] += n
+
+    def reset(self, *counters):
+        # forgets what's been counted so far, e.g., by a pass that isn't reported
+        for c in counters:
+            self.counts[c] = self._last_counts[c] = 0
+
+    def time(self, stage, started):
+        # started is a time.perf_counter() value
+        self.timings[stage] += time.perf_counter() - started
+
+    def saw_queue(self, queue_size):
+        if queue_size > self.queue_hwm:
+            self.queue_hwm = queue_size
+
+    def end_window(self, window, queue_size, g):
+        now = time.perf_counter()
+        row = dict(window=window, wall_s=now - self._last_window_time)
+        for c in Metrics.COUNTERS:
+            row[c] = self.counts[c] - self._last_counts[c]
+        for s in Metrics.STAGES:
+            row[f'{s}_s'] = self.timings[s] - self._last_timings[s]
+        row['queue_size'] = queue_size
+        row['queue_hwm'] = self.queue_hwm
+        row['nodes'] = g.number_of_nodes()
+        row['edges'] = g.number_of_edges()
+        row['rss_mb'] = rss_mb()
+        row['traced_peak_mb'] = (
+            tracemalloc.get_traced_memory()[1] / (1024 * 1024) if self.trace_memory else ''
+        )
+        self.windows.append(row)
+
+        self._last_window_time = now
+        self._last_counts = dict(self.counts)
+        self._last_timings = dict(self.timings)
+
+    def summary(self):
+        return dict(
+            wall_s = time.perf_counter() - self.start_time,
+            windows = len(self.windows),
+            queue_hwm = self.queue_hwm,
+            peak_rss_mb = peak_rss_mb(),
+            **self.counts,
+            entity_cache_hit_rate = self.counts['entity_cache_hits'] / max(1, self.counts['entity_cache_hits'] + self.counts['entity_cache_misses']),
+            **{ f'{s}_s' : t for s, t in self.timings.items() }
+        )
+
+    def top_allocations(self, limit=10):
+        if not self.trace_memory:
+            return []
+        snapshot = tracemalloc.take_snapshot()
+        return [str(stat) for stat in snapshot.statistics('lineno')[:limit]]
+
+    def write(self, fn):
+        """Writes the per-window rows as CSV, or as JSON (with the run summary)
+        if fn ends in '.json'."""
+        if fn.lower().endswith('.json'):
+            with open(fn, 'w', encoding='utf-8') as f:
+                json.dump(dict(summary=self.summary(), windows=self.windows), f, indent=2)
+        else:
+            with open(fn, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=Metrics.COLUMNS)
+                writer.writeheader()
+                writer.writerows(self.windows)
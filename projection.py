@@ -0,0 +1,168 @@
+import numpy as np
+
+# Computes a window's account-account co-activity as a projection of its
+# account x target incidence with scipy sparse matrices, as an alternative to
+# comparing every pair of events in Python (see BatchManager.process())
+
+PAIRS_PER_CHUNK = 1000000
+EVENTS_PER_BLOCK = 1000  # of early events whose text similarities are fanned out together
+
+
+def intern(values):
+    # (sorted distinct values, index of each value into them)
+    distinct = sorted(set(values))
+    ix = { x : i for i, x in enumerate(distinct) }
+    return distinct, np.fromiter((ix[x] for x in values), dtype=np.int64, count=len(values))
+
+
+def early_count(batch, d1_end_ts):
+    # events before d1_end_ts start pairs; the batch is in time order
+    for i, e in enumerate(batch):
+        if e['ts'] >= d1_end_ts:
+            return i
+    return len(batch)
+
+
+def ordered_pairs_within_targets(src, tgt, max_pairs=PAIRS_PER_CHUNK):
+    """Yields chunks of (earlier account, later account) for the pairs of
+    events with the same target, in time order, so that no more than about
+    max_pairs pairs are held at once, however many events share a target.
+    Targets with the same number of events are expanded together, to keep
+    the Python loop short."""
+    order = np.argsort(tgt, kind='stable')  # stays in time order per target
+    starts = np.flatnonzero(np.r_[True, np.diff(tgt[order]) != 0])
+    sizes = np.diff(np.r_[starts, len(order)])
+    for k in np.unique(sizes[sizes > 1]).tolist():
+        group_starts = starts[sizes == k]
+        pairs_per_target = k * (k - 1) // 2
+        if pairs_per_target <= max_pairs:
+            iu, ju = np.triu_indices(k, 1)
+            step = max_pairs // pairs_per_target
+            for lo in range(0, len(group_starts), step):
+                block = group_starts[lo:lo + step, None]
+                yield src[order[(block + iu).ravel()]], src[order[(block + ju).ravel()]]
+            continue
+        # too many pairs for one target, so a run of its earlier events at a
+        # time, each with all the events after it
+        for start in group_starts.tolist():
+            events = order[start:start + k]
+            i = 0
+            while i < k - 1:
+                j = min(k - 1, i + max(1, max_pairs // (k - i - 1)))
+                earlier = np.arange(i, j)
+                n_later = k - 1 - earlier
+                offsets = np.arange(n_later.sum()) - np.repeat(np.cumsum(n_later) - n_later, n_later)
+                earlier = np.repeat(earlier, n_later)
+                yield src[events[earlier]], src[events[earlier + 1 + offsets]]
+                i = j
+
+
+def coactivity(batch, d1_end_ts, target_key=None):
+    """Projects the window's events (in time order) onto their accounts.
+
+    As in BatchManager.process(), only events before d1_end_ts start pairs,
+    each pair of events on the same target by different accounts adds the
+    earlier event's 'scale' (1 if absent) to the accounts' edge weight, and
+    counts one 'first' for the account that was active earlier. An event's
+    'scale' must be the same for all the window's events on its target, as
+    throttle() makes it.
+
+    Returns (accounts, u, v, weight, first_u, first_v, matches) where u < v
+    index the sorted account ids (so 'u' is the lesser id) and matches is the
+    number of matching pairs of events.
+    """
+    from scipy.sparse import coo_matrix, triu
+
+    n = len(batch)
+    accounts, src = intern([e['src'] for e in batch])
+    targets, tgt = intern([target_key(e['tgt']) if target_key else e['tgt'] for e in batch])
+    scale = np.fromiter((e.get('scale', 1.0) for e in batch), dtype=np.float64, count=n)
+    ones = np.ones(n)
+    m = len(accounts)
+    e = early_count(batch, d1_end_ts)
+
+    # [a, b] is how often (or how much) a's event preceded b's on the same target
+
+    # every early event precedes every later one, so that's a product of the
+    # early and late account x target incidences
+    def incidence(data, lo, hi):
+        return coo_matrix((data[lo:hi], (src[lo:hi], tgt[lo:hi])), shape=(m, len(targets))).tocsr()
+    late = incidence(ones, e, n).T
+    weights = incidence(scale, 0, e) @ late
+    counts = incidence(ones, 0, e) @ late
+
+    # amongst the early events, how much two accounts matched is the product
+    # of their incidences, so it's added to the upper triangle (which also
+    # drops an account's pairs with itself)...
+    early = incidence(ones, 0, e)
+    weights = weights + triu(incidence(scale, 0, e) @ early.T, 1)
+    counts = counts + triu(early @ early.T, 1)
+    # ...but which was first depends on their events' order, so the pairs
+    # whose later account is the lesser are moved below the diagonal, a
+    # bounded chunk of pairs at a time
+    for rows, cols in ordered_pairs_within_targets(src[:e], tgt[:e]):
+        later_is_lesser = rows > cols
+        rows, cols = rows[later_is_lesser], cols[later_is_lesser]
+        if len(rows) > 0:
+            moves = np.r_[-np.ones(len(rows)), np.ones(len(rows))]
+            counts = counts + coo_matrix((moves, (np.r_[cols, rows], np.r_[rows, cols])), shape=(m, m)).tocsr()
+
+    return (accounts,) + undirected_edges(weights, counts)
+
+
+def similar_coactivity(batch, d1_end_ts, comparator, block_size=EVENTS_PER_BLOCK):
+    """As coactivity(), but for targets that match by text similarity, with
+    each matching pair of events adding its similarity (times the earlier
+    event's 'scale') to the accounts' edge weight. The distinct texts'
+    similarities come from comparator.similar_texts(), for the whole window
+    at once, and are fanned out to the accounts a block of early events at a
+    time: as a product of incidences with the events after the block, and
+    pair by pair within it."""
+    from scipy.sparse import coo_matrix, csr_matrix
+
+    n = len(batch)
+    accounts, src = intern([e['src'] for e in batch])
+    scale = np.fromiter((e.get('scale', 1.0) for e in batch), dtype=np.float64, count=n)
+    ones = np.ones(n)
+    m = len(accounts)
+    text_ix, scores = comparator.similar_texts([e['tgt'] for e in batch])
+    similar = scores.copy()
+    similar.data[:] = 1
+
+    def incidence(data, lo, hi):  # account x distinct text
+        return coo_matrix((data[lo:hi], (src[lo:hi], text_ix[lo:hi])), shape=(m, scores.shape[0])).tocsr()
+
+    weights = csr_matrix((m, m))
+    counts = csr_matrix((m, m))
+    e = early_count(batch, d1_end_ts)
+    for lo in range(0, e, block_size):
+        hi = min(e, lo + block_size)
+        after = incidence(ones, hi, n).T
+        weights = weights + incidence(scale, lo, hi) @ scores @ after
+        counts = counts + incidence(ones, lo, hi) @ similar @ after
+
+        if hi - lo < 2:
+            continue
+        earlier, later = np.triu_indices(hi - lo, 1)
+        earlier, later = earlier + lo, later + lo
+        similarity = np.asarray(scores[text_ix[earlier], text_ix[later]]).ravel()
+        matched = similarity > 0
+        earlier, later, similarity = earlier[matched], later[matched], similarity[matched]
+        rows, cols = src[earlier], src[later]
+        weights = weights + coo_matrix((similarity * scale[earlier], (rows, cols)), shape=(m, m)).tocsr()
+        counts = counts + coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(m, m)).tocsr()
+    return (accounts,) + undirected_edges(weights, counts)
+
+
+def undirected_edges(weights, counts):
+    """From the account x account matrices of how much and how often the row
+    account was active before the column account, returns (u, v, weight,
+    first_u, first_v, matches) where u < v (so 'u' is the lesser id) and
+    matches is the number of matching pairs of events."""
+    undirected = (weights + weights.T).tocoo()
+    upper = undirected.row < undirected.col  # also drops an account's pairs with itself
+    u, v = undirected.row[upper], undirected.col[upper]
+    first_u = np.asarray(counts[u, v]).ravel()
+    first_v = np.asarray(counts[v, u]).ravel()
+    matches = int(counts.sum() - counts.diagonal().sum())
+    return u, v, undirected.data[upper], first_u, first_v, matches
@@ -1,68 +1,161 @@
 #!/usr/bin/env python3
 
-import networkx as nx
+import analysis
+import glob
 # import ntpath  # https://stackoverflow.com/a/8384788
 import os
-import statistics
 import sys
+import utils
 
+from argparse import ArgumentParser
+from multiprocessing import Pool
 from utils import extract_filename
 
 
-def mew(g):
-    ews = [d['weight'] for u,v,d in g.edges(data=True)]
-    # using pstdev because we have the whole population of edge weights
-    return statistics.mean(ews), statistics.pstdev(ews)
+class Options:
+    def __init__(self):
+        self._init_parser()
 
+    def _init_parser(self):
+        usage = 'quick_stats.py [--header] [-o <stats.csv>] <weighted_graph.graphml | dir | glob>...'
 
-if __name__=='__main__':
-    if len(sys.argv) < 2:
-        print('Usage: quick_stats.py [--header] <weighted_graph.graphml>')
-        sys.exit(1)
+        self.parser = ArgumentParser(usage=usage)
+        self.parser.add_argument(
+            'graph_files',
+            nargs='+',
+            help='Weighted networks (graphml or npz), directories of them, or globs'
+        )
+        self.parser.add_argument(
+            '--header',
+            dest='header',
+            action='store_true',
+            default=False,
+            help='Output the column header (default: False)'
+        )
+        self.parser.add_argument(
+            '-o',
+            required=False,
+            default=None,
+            dest='out_file',
+            help='Where to write the CSV (default: stdout)'
+        )
+        self.parser.add_argument(
+            '-p', '--processes',
+            type=int,
+            default=None,
+            dest='processes',
+            help='Number of networks processed at once (default: number of cores)'
+        )
+        self.parser.add_argument(
+            '--skip-lc',
+            dest='skip_lc',
+            action='store_true',
+            default=False,
+            help='Leave the largest component columns empty, for speed (default: False)'
+        )
 
-    if sys.argv[1] == '--header':
-        gfn = sys.argv[2]
-        header = True
-    else:
-        gfn = sys.argv[1]
-        header = False
-    # print(f'{gfn} MEW: {mew(nx.read_graphml(gfn))}')
+    def parse(self, args=None):
+        return self.parser.parse_args(args)
 
-    g = nx.read_graphml(gfn)
 
-    if g.number_of_nodes() == 0:
-        print('Empty graph')
-        sys.exit(1)
+COLUMNS = (
+    'filename,nodes,edges,edge_weight_mean,edge_weight_stdev,density,components,' +
+    'largest_component_nodes,largest_component_edges,' +
+    'largest_component_edge_weight_mean,largest_component_edge_weight_stdev,' +
+    'largest_component_density'
+).split(',')
 
-    columns = (
-        'filename,nodes,edges,edge_weight_mean,edge_weight_stdev,density,components,' +
-        'largest_component_nodes,largest_component_edges,' +
-        'largest_component_edge_weight_mean,largest_component_edge_weight_stdev,' +
-        'largest_component_density'
-    ).split(',')
 
-    components = list(nx.connected_components(g))
-    lc = g.subgraph(max(components, key=len))
+def mew(g):
+    # mean and population stdev of an ArrayGraph's edge weights
+    return g.weight_stats()
+
 
+def stats_for(gfn, skip_lc=False):
+    """The COLUMNS for the network in gfn, or None if it's empty."""
+    g = analysis.read_graph(gfn)
+
+    if g.number_of_nodes() == 0:
+        return None
+
+    component_count, labels = g.component_labels()
     ew_mean, ew_stdev = mew(g)
-    lc_ew_mean, lc_ew_stdev = mew(lc)
     stats = dict(
         filename = extract_filename(gfn),
         nodes = g.number_of_nodes(),
         edges = g.number_of_edges(),
         edge_weight_mean = ew_mean,
         edge_weight_stdev = ew_stdev,
-        density = nx.density(g),
-        components = len(components),
+        density = g.density(),
+        components = component_count
+    )
+    if skip_lc:
+        return stats
+
+    lc = g.largest_component(labels)
+    lc_ew_mean, lc_ew_stdev = mew(lc)
+    stats.update(
         largest_component_nodes = lc.number_of_nodes(),
         largest_component_edges = lc.number_of_edges(),
         largest_component_edge_weight_mean = lc_ew_mean,
         largest_component_edge_weight_stdev = lc_ew_stdev,
-        largest_component_density = nx.density(lc)
+        largest_component_density = lc.density()
     )
+    return stats
 
-    if header:
-        print(','.join(columns))
-        # print(f'{gfn},nodes,edges,edge_weight_mean,edge_weight_stdev,density,big_c_nodes,big_c_edges,big_c_ew_mean,big_c_ew_stdev')
 
-    print(','.join([f'{stats[k]}' for k in columns]))
+def stats_for_args(args):
+    # Pool.imap passes a single argument
+    return args[0], stats_for(*args)
+
+
+def expand(paths):
+    # directories become the networks in them, globs their matches
+    gfns = []
+    for p in paths:
+        if os.path.isdir(p):
+            gfns += sorted(
+                glob.glob(os.path.join(p, '*.graphml')) + glob.glob(os.path.join(p, '*.graphml.gz')) +
+                glob.glob(os.path.join(p, '*.npz'))
+            )
+        else:
+            gfns += sorted(glob.glob(p)) or [p]
+    return gfns
+
+
+if __name__=='__main__':
+
+    options = Options()
+    opts = options.parse(sys.argv[1:])
+
+    gfns = expand(opts.graph_files)
+    # print(f'{gfn} MEW: {mew(nx.read_graphml(gfn))}')
+
+    out_f = open(opts.out_file, 'w', encoding='utf-8') if opts.out_file else sys.stdout
+    empty = 0
+    try:
+        if opts.header:
+            print(','.join(COLUMNS), file=out_f)
+            # print(f'{gfn},nodes,edges,edge_weight_mean,edge_weight_stdev,density,big_c_nodes,big_c_edges,big_c_ew_mean,big_c_ew_stdev')
+
+        if len(gfns) == 1:
+            results = [stats_for_args((gfns[0], opts.skip_lc))]
+        else:
+            pool = Pool(min(opts.processes or len(gfns), len(gfns)))
+            results = pool.imap(stats_for_args, [(gfn, opts.skip_lc) for gfn in gfns])
+
+        for gfn, stats in results:  # in the order given
+            if stats == None:
+                utils.eprint(f'Empty graph: {gfn}')
+                empty += 1
+                continue
+            print(','.join([f'{stats.get(k, "")}' for k in COLUMNS]), file=out_f)
+
+        if len(gfns) > 1:
+            pool.close()
+            pool.join()
+    finally:
+        if opts.out_file: out_f.close()
+
+    if empty == len(gfns):
+        sys.exit(1)
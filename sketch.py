@@ -0,0 +1,47 @@
+import numpy as np
+
+# A compact summary, from a first pass over the input, of which accounts use
+# each target, so that events on targets only ever used by one account (which
+# can't produce an edge) can be dropped before they reach a window
+
+
+class SourceSketch:
+    """Remembers, for each bucket of hashed targets, the hash of the first
+    account seen using it and whether any other account has used it since.
+
+    Targets that share a bucket only make may_match() keep more events, so
+    barring 64-bit hash collisions between accounts, an event is only dropped
+    if its target is used by a single account.
+    """
+
+    EMPTY = 0
+    ONE_SOURCE = 1
+    MANY_SOURCES = 2
+
+    def __init__(self, buckets, target_key=None):
+        self.buckets = buckets
+        self.target_key = target_key
+        self.sources = np.zeros(buckets, dtype=np.int64)  # first source's hash
+        self.states = np.zeros(buckets, dtype=np.int8)
+
+    def bucket(self, tgt):
+        return hash(self.target_key(tgt) if self.target_key else tgt) % self.buckets
+
+    def add(self, tgt, src):
+        b = self.bucket(tgt)
+        state = self.states[b]
+        if state == SourceSketch.EMPTY:
+            self.sources[b] = hash(src)
+            self.states[b] = SourceSketch.ONE_SOURCE
+        elif state == SourceSketch.ONE_SOURCE and self.sources[b] != hash(src):
+            self.states[b] = SourceSketch.MANY_SOURCES
+
+    def may_match(self, tgt):
+        return self.states[self.bucket(tgt)] == SourceSketch.MANY_SOURCES
+
+    def counts(self):
+        # (buckets used, buckets whose targets' events are kept)
+        return (
+            np.count_nonzero(self.states != SourceSketch.EMPTY),
+            np.count_nonzero(self.states == SourceSketch.MANY_SOURCES)
+        )
@@ -0,0 +1,231 @@
+import csv
+import gzip
+import heapq
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import zlib
+
+from itertools import groupby
+
+# Spills the structures that grow with the input (the CN's edges and the
+# window queue) to disk so a run can complete within a fixed memory budget
+
+# rough in-memory cost of an edge (with its share of nodes) in an nx.Graph and
+# of a queued event dict, used to estimate memory use deterministically
+EDGE_BYTES = 400
+EVENT_BYTES = 400
+
+
+def estimate_bytes(g, queue):
+    return g.number_of_edges() * EDGE_BYTES + len(queue) * EVENT_BYTES
+
+
+def edge_rows(g):
+    # (u, v, weight, first_u, first_v, last_ts, since_ts, history_id) with
+    # u < v, sorted
+    rows = []
+    for u, v, d in g.edges(data=True):
+        if u > v:
+            u, v = v, u
+        rows.append((
+            u, v, d['weight'], d['first_u'], d['first_v'],
+            d.get('last_ts'), d.get('since_ts'), d.get('history_id')
+        ))
+    rows.sort(key=lambda r: (r[0], r[1]))
+    return rows
+
+
+def read_run(fn):
+    def opt_int(s):
+        return int(s) if s != '' else None
+
+    def weight(s):
+        # as written, so int weights stay ints
+        return float(s) if '.' in s or 'e' in s else int(s)
+
+    with gzip.open(fn, 'rt', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)  # header
+        for u, v, w, fu, fv, last_ts, since_ts, history_id in reader:
+            yield (u, v, weight(w), float(fu), float(fv), opt_int(last_ts), opt_int(since_ts), opt_int(history_id))
+
+
+class HistoryIds:
+    """The history ids of spilled edges, by (u, v) with u < v, kept in an
+    SQLite file rather than in memory, so that edges re-created after being
+    spilled keep their ids without the mapping outgrowing the budget."""
+
+    def __init__(self, fn):
+        self.conn = sqlite3.connect(fn)
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE ids (u TEXT NOT NULL, v TEXT NOT NULL, history_id INTEGER NOT NULL, PRIMARY KEY (u, v)) WITHOUT ROWID'
+            )
+
+    def add(self, rows):
+        # rows of (u, v, history_id)
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO ids VALUES (?, ?, ?)', rows)
+
+    def pop(self, key, default=None):
+        # the edge's history id, forgotten now that the edge is back in memory
+        u, v = key
+        row = self.conn.execute('SELECT history_id FROM ids WHERE u = ? AND v = ?', (u, v)).fetchone()
+        if row == None:
+            return default
+        with self.conn:
+            self.conn.execute('DELETE FROM ids WHERE u = ? AND v = ?', (u, v))
+        return row[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class EdgeSpiller:
+    """Writes the CN's edges to disk as sorted runs of partial aggregates,
+    which are merged (summing weights and first counts) at finalisation."""
+    COLUMNS = ['u', 'v', 'weight', 'first_u', 'first_v', 'last_ts', 'since_ts', 'history_id']
+
+    def __init__(self, work_dir):
+        self.work_dir = work_dir
+        self.runs = []
+        # history ids of spilled edges, so re-created edges keep theirs
+        self.history_ids = HistoryIds(os.path.join(work_dir, 'history-ids.db'))
+
+    def spill(self, g):
+        rows = edge_rows(g)
+        fn = os.path.join(self.work_dir, f'edges-{len(self.runs):05d}.csv.gz')
+        with gzip.open(fn, 'wt', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(EdgeSpiller.COLUMNS)
+            writer.writerows(rows)
+        self.history_ids.add((u, v, history_id) for u, v, *_, history_id in rows if history_id != None)
+        self.runs.append(fn)
+        g.clear()
+        return len(rows)
+
+    def merged(self, g, decay):
+        """Yields (u, v, edge_data) for every edge in the runs and g, combining
+        partial aggregates of the same edge."""
+        streams = [read_run(fn) for fn in self.runs] + [iter(edge_rows(g))]
+        for (u, v), parts in groupby(heapq.merge(*streams, key=lambda r: (r[0], r[1])), key=lambda r: (r[0], r[1])):
+            d = None
+            for _, _, w, fu, fv, last_ts, since_ts, history_id in parts:
+                part = dict(weight=w, first_u=fu, first_v=fv)
+                if last_ts != None:
+                    part['last_ts'] = last_ts
+                    part['since_ts'] = since_ts
+                if history_id != None:
+                    part['history_id'] = history_id
+                if d == None:
+                    d = part
+                    continue
+                if decay.enabled:
+                    # the runs are in the order they were spilled, so part is
+                    # the edge's later co-activity
+                    d_factor, part_factor = decay.merge_factors(d['last_ts'], part['since_ts'], part['last_ts'])
+                    for k in ['weight', 'first_u', 'first_v']:
+                        d[k] = d[k] * d_factor + part[k] * part_factor
+                    if d_factor == 0:
+                        d['since_ts'] = part['since_ts']
+                    d['last_ts'] = max(d['last_ts'], part['last_ts'])
+                else:
+                    for k in ['weight', 'first_u', 'first_v']:
+                        d[k] += part[k]
+                if 'history_id' not in d and 'history_id' in part:
+                    d['history_id'] = part['history_id']
+            yield u, v, d
+
+    def cleanup(self):
+        for fn in self.runs:
+            os.remove(fn)
+        self.runs = []
+        self.history_ids.close()
+
+
+class QueueSpiller:
+    """Holds the window queue on disk, partitioned by (normalised) target so
+    that each partition can be compared on its own. Only valid when events can
+    only match events with the same target, i.e., not for TEXT_SIMILARITY."""
+
+    def __init__(self, work_dir, partitions, lower_targets=False):
+        self.work_dir = work_dir
+        self.partition_count = partitions
+        self.lower_targets = lower_targets
+        self.spilled = False
+
+    def partition_of(self, e):
+        tgt = str(e['tgt']).lower() if self.lower_targets else str(e['tgt'])
+        return zlib.crc32(tgt.encode('utf-8')) % self.partition_count
+
+    def partition_fn(self, p):
+        return os.path.join(self.work_dir, f'queue-{p:04d}.jsonl')
+
+    def spill(self, queue):
+        # appends the queue's events to their partitions, emptying the queue
+        by_partition = {}
+        for e in queue:
+            by_partition.setdefault(self.partition_of(e), []).append(e)
+        for p, p_events in by_partition.items():
+            with open(self.partition_fn(p), 'a', encoding='utf-8') as f:
+                for e in p_events:
+                    f.write(json.dumps(e))
+                    f.write('\n')
+        self.spilled = True
+        del queue[:]
+
+    def _read(self, p):
+        fn = self.partition_fn(p)
+        if not os.path.exists(fn):
+            return []
+        with open(fn, encoding='utf-8') as f:
+            return [json.loads(l) for l in f]
+
+    def partitions(self, queue):
+        """Yields each partition's events in time order, combining those on
+        disk with those since queued in memory."""
+        in_memory = {}
+        for e in queue:
+            in_memory.setdefault(self.partition_of(e), []).append(e)
+        for p in range(self.partition_count):
+            events = self._read(p) + in_memory.get(p, [])
+            if events:
+                yield p, events
+
+    def replace(self, p, events):
+        # overwrites partition p with the events still to be retained
+        fn = self.partition_fn(p)
+        if events:
+            with open(fn, 'w', encoding='utf-8') as f:
+                for e in events:
+                    f.write(json.dumps(e))
+                    f.write('\n')
+        elif os.path.exists(fn):
+            os.remove(fn)
+
+    def unspill(self):
+        # reads the whole queue back into memory, in time order
+        queue = list(heapq.merge(
+            *[self._read(p) for p in range(self.partition_count)], key=lambda e: e['ts']
+        ))
+        self.cleanup()
+        return queue
+
+    def cleanup(self):
+        for p in range(self.partition_count):
+            fn = self.partition_fn(p)
+            if os.path.exists(fn):
+                os.remove(fn)
+        self.spilled = False
+
+
+def make_work_dir(out_filebase):
+    parent = os.path.dirname(os.path.abspath(out_filebase))
+    return tempfile.mkdtemp(prefix='spill-', dir=parent)
+
+
+def remove_work_dir(work_dir):
+    shutil.rmtree(work_dir, ignore_errors=True)
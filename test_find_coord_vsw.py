@@ -0,0 +1,107 @@
+import gen_synthetic_data
+import history
+import networkx as nx
+import os.path
+import pytest
+import subprocess
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from detector import CoordinationDetector
+
+# Checks that the ways of running find_coord_vsw.py that trade memory for disk
+# find the same CN as the plain in-memory run. Run with: python -m pytest -q
+
+
+@pytest.fixture(scope='module')
+def events():
+    cfg = gen_synthetic_data.config_from(gen_synthetic_data.Options().parse([
+        '-n', '4000', '--accounts', '300', '--duration', '6h', '--seed', '7'
+    ]))
+    return [
+        dict(ts=ts, src=src, tgt=tgt, t_id=f'{i}')
+        for i, (ts, src, tgt, _) in enumerate(gen_synthetic_data.generate_events(cfg))
+    ]
+
+
+def find_coord(*args):
+    subprocess.run(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'find_coord_vsw.py')]
+        + list(args), check=True, capture_output=True
+    )
+
+
+def weights(g):
+    return { frozenset((u, v)) : w for u, v, w in g.edges(data='weight') }
+
+
+def assert_same_weights(expected, actual, same_types=False):
+    assert expected.keys() == actual.keys()
+    for k, w in expected.items():
+        assert actual[k] == pytest.approx(w)
+        if same_types:
+            assert type(actual[k]) == type(w)
+
+
+def detect(events, decay, **options):
+    # no pruning of light decayed edges, which only happens in memory when
+    # spilling
+    return CoordinationDetector(
+        '10m', '20m', decay_strategy=decay, decay_period='30m',
+        decay_min_edge_weight=0, **options
+    ).detect(events)
+
+
+@pytest.mark.parametrize('decay', ['NONE', 'EXPIRY', 'HALF_LIFE'])
+def test_max_memory_matches_in_memory(events, decay):
+    in_memory = detect(events, decay)
+    spilled = detect(events, decay, max_memory='1M')
+    assert in_memory.number_of_edges() > 0
+    assert_same_weights(weights(in_memory), weights(spilled), same_types=decay == 'NONE')
+
+
+@pytest.mark.parametrize('decay', ['NONE', 'EXPIRY', 'HALF_LIFE'])
+def test_edge_store_matches_in_memory(events, decay, tmp_path):
+    in_memory = detect(events, decay)
+    stored = detect(events, decay, edge_store=str(tmp_path / 'edges.db'))
+    assert in_memory.number_of_edges() > 0
+    assert_same_weights(weights(in_memory), weights(stored), same_types=decay == 'NONE')
+
+
+def test_concurrent_histories_are_kept_apart(events, tmp_path):
+    detector = CoordinationDetector(
+        '10m', '20m', keep_history=True, history_chunk_size=1000,
+        out_filebase=str(tmp_path / 'cn')
+    )
+    halves = [events[:len(events) // 2], events[len(events) // 2:]]
+    with ThreadPoolExecutor(2) as pool:
+        gs = list(pool.map(detector.detect, halves))
+    assert gs[0].graph['history_filebase'] != gs[1].graph['history_filebase']
+    for g in gs:
+        # every edge's co-activities are still on disk
+        edge_ids = set(d['history_id'] for _, _, d in g.edges(data=True))
+        rows = history.read_history(g.graph['history_filebase'])
+        assert set(int(r['edge_id']) for r in rows) == edge_ids
+
+
+def test_prefilter_keeps_saved_queue_events(tmp_path):
+    # solo1's and solo2's only uses of 'shared' straddle the two inputs
+    events = [(i * 60, f'acct{i % 3}', f'tgt{i % 2}') for i in range(30)]
+    first = events + [(1790, 'solo1', 'shared')]
+    second = [(1800, 'solo2', 'shared')] + [(1800 + i * 60, f'acct{i % 3}', f'tgt{i % 2}') for i in range(1, 30)]
+    for fn, rows in [('first.csv', first), ('second.csv', second), ('all.csv', first + second)]:
+        gen_synthetic_data.write_csv([(ts, src, tgt, tgt) for ts, src, tgt in rows], tmp_path / fn)
+
+    def final_g(in_file, out_filebase, *args):
+        find_coord(
+            '-i', str(tmp_path / in_file), '-o', str(tmp_path / out_filebase),
+            '-d1', '5m', '-d2', '10m', '--final-g-only', '--prefilter', *args
+        )
+        return nx.read_graphml(tmp_path / f'{out_filebase}-FINAL.graphml')
+
+    state = str(tmp_path / 'state.pkl.gz')
+    one_run = final_g('all.csv', 'all')
+    final_g('first.csv', 'first', '--save-state', state)
+    appended = final_g('second.csv', 'second', '--append-to', state)
+    assert one_run.has_edge('solo1', 'solo2')
+    assert_same_weights(weights(one_run), weights(appended))
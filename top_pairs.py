@@ -0,0 +1,116 @@
+import heapq
+import math
+import numpy as np
+
+from hashlib import blake2b
+
+from spill import edge_rows
+
+# Keeps only the strongest coordinating pairs in a fixed amount of memory,
+# however long the input: each window's edges are added to a Count-Min sketch
+# of pair weights, and the pairs with the highest estimates are tracked
+# SpaceSaving-style, evicting the weakest when a stronger pair turns up
+
+
+class TopPairs:
+    """Approximates the k heaviest CN edges, as an edge store for BatchManager.
+
+    Each pair's weight estimate is its Count-Min sketch estimate, which is
+    never less than its true weight, and with probability 1 - e^-depth, no
+    more than e / width of the total weight seen over it. The weight and
+    first counts added while a pair was tracked are exact, so they are lower
+    bounds. Only 4k pairs are tracked, however many there are.
+    """
+
+    def __init__(self, k, width, depth=4):
+        self.k = k
+        self.capacity = 4 * k
+        self.width = width
+        self.depth = depth
+        self.sketch = np.zeros((depth, width), dtype=np.float64)
+        self.salts = [d.to_bytes(16, 'little') for d in range(depth)]  # one hash per row
+        self.total_weight = 0.0
+        self.tracked = {}  # (u, v) -> [estimate, weight seen, first_u seen, first_v seen]
+        self.heap = []  # (estimate, (u, v)), including stale estimates
+
+    @property
+    def fn(self):
+        # describes the store when it's read back, like SqliteEdgeStore.fn
+        return (
+            f'the top {self.k:,} pairs sketch (estimates within +{self.error_bound():,.1f} '
+            f'with probability {1 - math.exp(-self.depth):.0%})'
+        )
+
+    def estimates(self, keys, weights):
+        # adds the weights to the sketch, returning the keys' new estimates
+        cols = self.columns(keys)
+        for d in range(self.depth):
+            np.add.at(self.sketch[d], cols[d], weights)
+        self.total_weight += weights.sum()
+        return self.sketch[np.arange(self.depth)[:, None], cols].min(axis=0)
+
+    def columns(self, keys):
+        # the keys' columns in each row of the sketch, hashed the same way in
+        # every run (unlike hash(), which is salted per process)
+        encoded = [f'{u}\t{v}'.encode('utf-8') for u, v in keys]
+        return np.array([
+            [int.from_bytes(blake2b(key, digest_size=8, salt=salt).digest(), 'little') % self.width for key in encoded]
+            for salt in self.salts
+        ])
+
+    def upsert(self, g):
+        """Adds g's edges to the sketch and the tracked pairs, returning how many."""
+        rows = edge_rows(g)
+        if not rows:
+            return 0
+        keys = [(u, v) for u, v, *_ in rows]
+        weights = np.array([w for _, _, w, *_ in rows], dtype=np.float64)
+        for key, estimate, (_, _, w, first_u, first_v, *_) in zip(keys, self.estimates(keys, weights).tolist(), rows):
+            entry = self.tracked.get(key)
+            if entry != None:
+                entry[0] = estimate
+                entry[1] += w
+                entry[2] += first_u
+                entry[3] += first_v
+            elif len(self.tracked) < self.capacity:
+                self.tracked[key] = [estimate, w, first_u, first_v]
+            elif estimate > self.weakest():
+                del self.tracked[heapq.heappop(self.heap)[1]]
+                self.tracked[key] = [estimate, w, first_u, first_v]
+            else:
+                continue
+            heapq.heappush(self.heap, (estimate, key))
+
+        if len(self.heap) > 4 * self.capacity:  # too many stale estimates
+            self.heap = [(entry[0], key) for key, entry in self.tracked.items()]
+            heapq.heapify(self.heap)
+        return len(rows)
+
+    def weakest(self):
+        # the lowest estimate of a tracked pair, leaving its entry on the heap
+        while self.heap[0][1] not in self.tracked or self.tracked[self.heap[0][1]][0] != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0]
+
+    def error_bound(self):
+        # how far any estimate may exceed the true weight, with probability
+        # 1 - e^-depth
+        return math.e / self.width * self.total_weight
+
+    def history_id(self, u, v):
+        return None
+
+    def edges(self, now_ts=None, min_ew=-1.0):
+        """Yields (u, v, edge_data) for the k pairs with the highest estimated
+        weights that are at least min_ew, with the estimate as 'weight' and
+        the weight seen while tracked as 'weight_min'."""
+        top = heapq.nlargest(self.k, self.tracked.items(), key=lambda item: item[1][0])
+        for (u, v), (estimate, w, first_u, first_v) in sorted(top):
+            if estimate >= min_ew:
+                yield u, v, dict(weight=estimate, weight_min=w, first_u=first_u, first_v=first_v)
+
+    def number_of_edges(self):
+        return min(self.k, len(self.tracked))
+
+    def close(self):
+        pass
@@ -1,6 +1,5 @@
 from __future__ import print_function
 from datetime import datetime
-from dateutil import parser
 
 
 import calendar
@@ -229,27 +228,29 @@ def extract_domain(url, lower=False):
     return strip_tail.lower() if lower else strip_tail
 
 
+def available_text(t):
+    """Gets the text of the tweet itself, without any it retweets or quotes."""
+    if t['truncated'] and 'extended_tweet' in t:
+        # if a tweet is retreived in 'compatible' mode, it may be
+        # truncated _without_ the associated extended_tweet
+        #eprint('#%s' % t['id_str'])
+        return t['extended_tweet']['full_text']
+    else:
+        return t['full_text'] if 'full_text' in t else t['text']
+
+
 def extract_text(tweet):
     """Gets the full text from a tweet if it's short or long (extended)."""
 
-    def get_available_text(t):
-        if t['truncated'] and 'extended_tweet' in t:
-            # if a tweet is retreived in 'compatible' mode, it may be
-            # truncated _without_ the associated extended_tweet
-            #eprint('#%s' % t['id_str'])
-            return t['extended_tweet']['full_text']
-        else:
-            return t['full_text'] if 'full_text' in t else t['text']
-
     if 'retweeted_status' in tweet:
         rt = tweet['retweeted_status']
         return 'RT @%s: %s' % (rt['user']['screen_name'], extract_text(rt))
 
     if 'quoted_status' in tweet:
         qt = tweet['quoted_status']
-        return get_available_text(tweet) + " --> " + extract_text(qt)
+        return available_text(tweet) + " --> " + extract_text(qt)
 
-    return get_available_text(tweet)
+    return available_text(tweet)
 
 
 def parse_window_cli_arg(w_str):